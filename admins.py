@@ -0,0 +1,104 @@
+from pyrogram import enums
+from cache import LRUCache
+from metrics import api_calls
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = (enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER)
+
+class AdminCache:
+    """Per-chat cache of administrator IDs.
+
+    Lookups are a set membership test. There is no periodic refresh: an entry
+    older than ttl is refreshed in the background on its next lookup and served
+    meanwhile, and chats with no entry are filled on demand. Chat-member
+    updates patch the set directly.
+    """
+
+    def __init__(self, maxsize=10000, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.refresh_count = 0
+        self.last_refresh = None
+        self._admins = LRUCache(maxsize)
+        self._refreshing = {}
+
+    async def _fetch(self, client, chat_id):
+        api_calls.inc("get_chat_members")
+        admin_ids = set()
+        async for member in client.get_chat_members(chat_id, filter=enums.ChatMembersFilter.ADMINISTRATORS):
+            admin_ids.add(member.user.id)
+        now = time.monotonic()
+        self._store(chat_id, admin_ids, now)
+        self.refresh_count += 1
+        self.last_refresh = now
+        return admin_ids
+
+    def _store(self, chat_id, admin_ids, refreshed_at):
+        self._admins.set(chat_id, (admin_ids, refreshed_at))
+
+    def refresh(self, client, chat_id):
+        """Start (or join) a refresh of chat_id's admin set and return its task."""
+        task = self._refreshing.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(client, chat_id))
+            self._refreshing[chat_id] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(chat_id, None))
+        return task
+
+    def _refresh_in_background(self, client, chat_id):
+        # A refresh already in flight has its own callback or a caller awaiting it
+        if chat_id not in self._refreshing:
+            self.refresh(client, chat_id).add_done_callback(self._log_background_failure)
+
+    @staticmethod
+    def _log_background_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background admin refresh failed error=%s", task.exception())
+
+    async def get_admins(self, client, chat_id):
+        """Return the set of admin IDs for chat_id."""
+        entry = self._admins.get(chat_id)
+        if entry is None:
+            return await self.refresh(client, chat_id)
+        admin_ids, refreshed_at = entry
+        if time.monotonic() - refreshed_at > self.ttl:
+            self._refresh_in_background(client, chat_id)
+        return admin_ids
+
+    async def is_admin(self, client, chat_id, user_id):
+        return user_id in await self.get_admins(client, chat_id)
+
+    def apply_member_update(self, update):
+        """Patch the cached admin set from a ChatMemberUpdated event."""
+        entry = self._admins.peek(update.chat.id)
+        if entry is None or update.new_chat_member is None:
+            return
+        admin_ids, _ = entry
+        user_id = update.new_chat_member.user.id
+        if update.new_chat_member.status in ADMIN_STATUSES:
+            admin_ids.add(user_id)
+        else:
+            admin_ids.discard(user_id)
+
+    def invalidate(self, chat_id):
+        self._admins.invalidate(chat_id)
+
+    def seconds_since_refresh(self, chat_id=None):
+        """Age of chat_id's admin set, or of the most recent refresh overall."""
+        if chat_id is None:
+            refreshed_at = self.last_refresh
+        else:
+            entry = self._admins.peek(chat_id)
+            refreshed_at = entry[1] if entry else None
+        return None if refreshed_at is None else time.monotonic() - refreshed_at
+
+    def stats(self):
+        return {
+            "chats": len(self._admins),
+            "refresh_count": self.refresh_count,
+            "seconds_since_refresh": self.seconds_since_refresh()
+        }
@@ -0,0 +1,136 @@
+"""Offline throughput benchmark for the group-message path.
+
+Drives the real bot.check_bio -> ingest queue -> check_messages ->
+get_group_settings -> apply_punishment path with a synthetic stream of group messages, using FakeClient in place
+of Telegram and InMemoryMongoClient in place of MongoDB. Needs the packages in
+requirements.txt, but no network, credentials or database.
+
+Run from the repository root:
+
+    python benchmarks/bench_handlers.py --messages 5000 --latency 0.02 --rate 2000
+
+Reports throughput and p50/p99 end-to-end latency per message, from
+check_bio queueing it to its check finishing (time spent waiting in the
+ingest queue included), plus checks run, messages merged into another
+check or dropped, and API calls per message.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The bot reads its configuration at import time
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "0" * 32)
+os.environ.setdefault("BOT_TOKEN", "1:benchmark")
+os.environ.setdefault("MONGO_URI", "mongodb://in-memory")
+# Measure handler overhead rather than the production outbound rate limits
+os.environ.setdefault("ACTION_GLOBAL_RATE", "1000000")
+os.environ.setdefault("ACTION_GLOBAL_BURST", "1000000")
+os.environ.setdefault("ACTION_CHAT_RATE", "1000000")
+os.environ.setdefault("ACTION_CHAT_BURST", "1000000")
+os.environ.setdefault("ACTION_DELETE_WINDOW", "0.01")
+# Queue the whole stream instead of shedding it
+os.environ.setdefault("INGEST_MAX_QUEUED", "1000000")
+os.environ.setdefault("INGEST_CHAT_QUEUED", "1000000")
+
+import pymongo
+
+from fakes import FakeChat, FakeClient, FakeMessage, FakeUser, InMemoryMongoClient
+
+pymongo.MongoClient = InMemoryMongoClient
+
+CLEAN_BIOS = ["", "Just a student 📚", "Coffee, code and cats", "Proud Indian 🇮🇳", "Musician 🎸"]
+LINK_BIOS = ["Join t.me/freecrypto", "visit earnfast[.]xyz", "https://spam.example.com/offer"]
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def build_stream(args, client):
+    rng = random.Random(args.seed)
+    chats = [FakeChat(-100_000_000 - i) for i in range(args.chats)]
+    users = list(client.users.values())
+    for _ in range(args.messages):
+        yield FakeMessage(client, rng.choice(chats), rng.choice(users))
+
+def build_users(args):
+    rng = random.Random(args.seed)
+    users = []
+    for i in range(args.users):
+        bio = rng.choice(LINK_BIOS) if rng.random() < args.link_ratio else rng.choice(CLEAN_BIOS)
+        username = f"user{i}" if rng.random() < 0.5 else None
+        users.append(FakeUser(10_000 + i, f"User{i}", rng.choice([None, "Smith"]), username, bio))
+    return users
+
+async def run(args):
+    import bot
+    import database
+    from punishments import warning_store
+    from scheduler import action_scheduler
+    from ingest import ingest_queue
+
+    client = FakeClient(build_users(args), latency=args.latency, flood_rate=args.flood_rate,
+                        flood_wait=args.flood_wait, seed=args.seed)
+    submitted = {}
+    latencies = []
+
+    check_messages = bot.check_messages
+
+    async def timed_check(client, messages):
+        await check_messages(client, messages)
+        now = time.perf_counter()
+        latencies.extend(now - submitted.pop(message.id) for message in messages)
+
+    bot.check_messages = timed_check
+
+    start = time.perf_counter()
+    for i, message in enumerate(build_stream(args, client)):
+        if args.rate:
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        submitted[message.id] = time.perf_counter()
+        await bot.check_bio(client, message)
+    await ingest_queue.join()
+    elapsed = time.perf_counter() - start
+    await ingest_queue.close()
+    await action_scheduler.close()
+    await warning_store.close()
+
+    latencies.sort()
+    api_calls = sum(client.calls.values())
+    ingest = ingest_queue.stats()
+    print(f"messages          {args.messages}")
+    print(f"handled           {len(latencies)} ({ingest['processed']} checks, {ingest['merged']} merged, {ingest['dropped']} dropped)")
+    print(f"throughput        {len(latencies) / elapsed:,.0f} msg/s, {ingest['processed'] / elapsed:,.0f} checks/s")
+    print(f"latency p50       {percentile(latencies, 0.50) * 1000:.2f} ms")
+    print(f"latency p99       {percentile(latencies, 0.99) * 1000:.2f} ms")
+    print(f"api calls/msg     {api_calls / args.messages:.3f}")
+    for method, count in sorted(client.calls.items()):
+        print(f"  {method:<22} {count}")
+    print(f"flood waits       {client.flood_waits}")
+    print(f"mongo ops         {dict(database.mongo_client.ops())}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for check_bio")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--link-ratio", type=float, default=0.05, help="fraction of users with a link in their bio")
+    parser.add_argument("--rate", type=float, default=0, help="messages arriving per second, 0 for all at once")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean simulated API latency in seconds")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="probability an API call raises FloodWait")
+    parser.add_argument("--flood-wait", type=int, default=1, help="FloodWait duration in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
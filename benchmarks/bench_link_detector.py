@@ -0,0 +1,53 @@
+"""Microbenchmark for link_detector over a corpus of real-world style bios.
+
+Run from the repository root:
+
+    python benchmarks/bench_link_detector.py [--seconds N]
+
+Reports scans per second for the uncached matcher, the memoized matcher and
+the legacy url_pattern regex it replaced, plus how many bios each flags.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from link_detector import LinkDetector
+
+LEGACY_URL_PATTERN = re.compile(
+    r'(https?://|www\.)[a-zA-Z0-9.\-]+(\.[a-zA-Z]{2,})+(/[a-zA-Z0-9._%+-]*)*'
+)
+
+def load_corpus():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bios.txt")
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip() and not line.startswith("#")]
+
+def measure(name, func, corpus, seconds):
+    scans = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for bio in corpus:
+            func(bio)
+        scans += len(corpus)
+    elapsed = time.perf_counter() - start
+    flagged = sum(1 for bio in corpus if func(bio))
+    print(f"{name:<12} {scans / elapsed:>12,.0f} scans/s   flagged {flagged}/{len(corpus)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="time budget per matcher")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    detector = LinkDetector()
+    measure("scan", detector.scan, corpus, args.seconds)
+    measure("memoized", detector.has_link, corpus, args.seconds)
+    measure("legacy", lambda bio: LEGACY_URL_PATTERN.search(bio) is not None, corpus, args.seconds)
+
+if __name__ == "__main__":
+    main()
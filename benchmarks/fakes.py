@@ -0,0 +1,250 @@
+"""In-process stand-ins for Telegram and MongoDB used by the offline benchmarks.
+
+FakeClient implements the subset of pyrogram.Client the handlers call, with
+configurable per-call latency and FloodWait injection, and counts calls by
+method. InMemoryMongoClient implements the subset of pymongo the database
+layer uses, so the real database.py code runs unchanged on top of it.
+"""
+from collections import Counter
+import asyncio
+import itertools
+import random
+
+import pymongo.errors
+from pymongo import ReturnDocument
+from pyrogram import errors, enums
+
+# ---------------------------------------------------------------------------
+# MongoDB
+
+def _matches(doc, query):
+    return all(doc.get(key) == value for key, value in query.items())
+
+def _apply_update(doc, update):
+    for key, value in update.get("$set", {}).items():
+        doc[key] = value
+    for key, value in update.get("$inc", {}).items():
+        doc[key] = doc.get(key, 0) + value
+
+class InMemoryCollection:
+    """Dict-backed collection supporting equality filters, $set, $setOnInsert and $inc."""
+
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self.ops = Counter()
+
+    def _find(self, query):
+        for doc in self.docs:
+            if _matches(doc, query):
+                return doc
+        return None
+
+    def find_one(self, query):
+        self.ops["find_one"] += 1
+        doc = self._find(query)
+        return dict(doc) if doc else None
+
+    def find(self, query=None, projection=None):
+        self.ops["find"] += 1
+        return [dict(doc) for doc in self.docs if _matches(doc, query or {})]
+
+    def _upsert(self, query, update, upsert):
+        doc = self._find(query)
+        if doc is None:
+            if not upsert:
+                return None
+            doc = dict(query)
+            doc.update(update.get("$setOnInsert", {}))
+            self.docs.append(doc)
+        _apply_update(doc, update)
+        return doc
+
+    def update_one(self, query, update, upsert=False):
+        self.ops["update_one"] += 1
+        self._upsert(query, update, upsert)
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=ReturnDocument.BEFORE):
+        self.ops["find_one_and_update"] += 1
+        before = self._find(query)
+        before = dict(before) if before else None
+        doc = self._upsert(query, update, upsert)
+        return dict(doc) if return_document == ReturnDocument.AFTER and doc else before
+
+    def delete_one(self, query):
+        self.ops["delete_one"] += 1
+        doc = self._find(query)
+        if doc is not None:
+            self.docs.remove(doc)
+
+    def bulk_write(self, operations, ordered=True):
+        self.ops["bulk_write"] += 1
+        for op in operations:
+            if getattr(op, "_doc", None) is None:
+                doc = self._find(op._filter)
+                if doc is not None:
+                    self.docs.remove(doc)
+            else:
+                self._upsert(op._filter, op._doc, op._upsert)
+
+    def create_index(self, keys, **kwargs):
+        self.ops["create_index"] += 1
+        return str(keys)
+
+    def watch(self, *args, **kwargs):
+        raise pymongo.errors.OperationFailure("The $changeStream stage is only supported on replica sets")
+
+class InMemoryDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = InMemoryCollection(name)
+        return self.collections[name]
+
+class _InMemoryAdmin:
+    def command(self, *args, **kwargs):
+        return {"ok": 1}
+
+class InMemoryMongoClient:
+    """Drop-in for pymongo.MongoClient that keeps everything in process."""
+
+    def __init__(self, *args, **kwargs):
+        self.databases = {}
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = InMemoryDatabase()
+        return self.databases[name]
+
+    @property
+    def admin(self):
+        return _InMemoryAdmin()
+
+    def server_info(self):
+        return {"version": "in-memory"}
+
+    def ops(self):
+        total = Counter()
+        for database in self.databases.values():
+            for collection in database.collections.values():
+                total.update(collection.ops)
+        return total
+
+# ---------------------------------------------------------------------------
+# Telegram
+
+class FakeUser:
+    def __init__(self, user_id, first_name, last_name=None, username=None, bio=""):
+        self.id = user_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.username = username
+        self.bio = bio
+        self.is_bot = False
+
+    @property
+    def mention(self):
+        return f"[{self.first_name}](tg://user?id={self.id})"
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+        self.type = enums.ChatType.SUPERGROUP
+
+class FakeMember:
+    def __init__(self, user, status):
+        self.user = user
+        self.status = status
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, client, chat, from_user, text="hello"):
+        self._client = client
+        self.id = next(self._ids)
+        self.chat = chat
+        self.from_user = from_user
+        self.text = text
+        self.new_chat_members = None
+
+    async def reply_text(self, text, **kwargs):
+        await self._client._call("send_message")
+        return FakeMessage(self._client, self.chat, self._client.me, text)
+
+    async def edit(self, text, **kwargs):
+        await self._client._call("edit_message_text")
+        self.text = text
+        return self
+
+    edit_text = edit
+
+    async def delete(self):
+        await self._client._call("delete_messages")
+        return True
+
+class FakeClient:
+    """Stand-in for pyrogram.Client with latency and FloodWait injection.
+
+    latency is the mean simulated round trip per API call in seconds (with
+    +/-50% jitter). flood_rate is the probability that any call raises
+    FloodWait(flood_wait) instead of succeeding.
+    """
+
+    def __init__(self, users, admins=(), latency=0.02, flood_rate=0.0, flood_wait=1, seed=0):
+        self.users = {user.id: user for user in users}
+        self.admins = set(admins)
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_wait = flood_wait
+        self.calls = Counter()
+        self.flood_waits = 0
+        self.me = FakeUser(1, "Bio Bot", username="bio_bot")
+        self._random = random.Random(seed)
+
+    async def _call(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self._random.uniform(0.5, 1.5))
+        if self.flood_rate and self._random.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise errors.FloodWait(value=self.flood_wait)
+
+    async def get_me(self):
+        await self._call("get_me")
+        return self.me
+
+    async def get_chat(self, chat_id):
+        await self._call("get_chat")
+        return self.users[chat_id]
+
+    async def get_chat_members(self, chat_id, filter=None, **kwargs):
+        await self._call("get_chat_members")
+        if filter == enums.ChatMembersFilter.ADMINISTRATORS:
+            for user_id in self.admins:
+                yield FakeMember(self.users[user_id], enums.ChatMemberStatus.ADMINISTRATOR)
+            return
+        for user in self.users.values():
+            status = enums.ChatMemberStatus.ADMINISTRATOR if user.id in self.admins else enums.ChatMemberStatus.MEMBER
+            yield FakeMember(user, status)
+
+    async def restrict_chat_member(self, chat_id, user_id, permissions, **kwargs):
+        await self._call("restrict_chat_member")
+        return True
+
+    async def ban_chat_member(self, chat_id, user_id, **kwargs):
+        await self._call("ban_chat_member")
+        return True
+
+    async def unban_chat_member(self, chat_id, user_id):
+        await self._call("unban_chat_member")
+        return True
+
+    async def delete_messages(self, chat_id, message_ids, **kwargs):
+        await self._call("delete_messages")
+        return len(message_ids) if isinstance(message_ids, list) else 1
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._call("send_message")
+        return FakeMessage(self, FakeChat(chat_id), self.me, text)
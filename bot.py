@@ -1,17 +1,32 @@
-from pyrogram import Client, filters, enums, errors
+import log
+from pyrogram import Client, filters, enums, errors, idle
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ChatPermissions
-from database import get_group_settings, update_group_settings, store_user
-from punishments import apply_punishment, warnings
+from database import get_group_settings, update_group_settings, ensure_group_settings, store_user, start_settings_watcher, settings_cache, settings_flight, users_writer, groups_writer, connect
+from punishments import apply_punishment, warning_store
+from scheduler import action_scheduler, PRIORITY_ADMIN
+from ingest import ingest_queue, PRIORITY_JOIN
+from link_detector import has_link, CATEGORY_MENTION, DEFAULT_CATEGORIES
+from cache import UserProfileCache
+from admins import AdminCache
+from verdicts import BioVerdictCache
+from sharding import shard_filter, shard_count, shard_id, ShardLease
+from startup import StartupTimer
+from scanner import MemberScanner
+from metrics import timed, api_calls, record_flood_wait, register_stats, start_metrics_server
 from dotenv import load_dotenv
+import asyncio
+import functools
+import logging
 import os
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Debug: Print environment variables
-print(f"DEBUG: API_ID = {os.getenv('API_ID')}")
-print(f"DEBUG: API_HASH = {os.getenv('API_HASH')}")
-print(f"DEBUG: BOT_TOKEN = {os.getenv('BOT_TOKEN')}")
+logger = logging.getLogger("bot")
+
+# Never log the secrets themselves
+logger.debug("Credentials api_id=%s api_hash_set=%s bot_token_set=%s",
+             os.getenv("API_ID"), bool(os.getenv("API_HASH")), bool(os.getenv("BOT_TOKEN")))
 
 # User Client setup
 api_id = os.getenv("API_ID")
@@ -20,38 +35,120 @@ bot_token = os.getenv("BOT_TOKEN")
 
 # Validate credentials
 if not all([api_id, api_hash, bot_token]):
-    print("ERROR: Missing API_ID, API_HASH, or BOT_TOKEN in .env")
+    logger.error("Missing API_ID, API_HASH, or BOT_TOKEN in .env")
     exit(1)
 
 try:
     api_id = int(api_id)  # Ensure API_ID is an integer
 except ValueError:
-    print("ERROR: API_ID must be an integer")
+    logger.error("API_ID must be an integer")
     exit(1)
 
-app = Client("my_bot", api_id=api_id, api_hash=api_hash, bot_token=bot_token)
+# Each shard worker needs its own session file
+session_name = "my_bot" if shard_count == 1 else f"my_bot_shard{shard_id}"
+app = Client(session_name, api_id=api_id, api_hash=api_hash, bot_token=bot_token)
+
+# User profile cache in front of client.get_chat
+# Bio checks always refetch through this cache (see verdicts.py), so the TTL
+# only bounds the profiles looked up for unmute/unban buttons.
+profile_cache = UserProfileCache(
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("PROFILE_CACHE_TTL", "300"))
+)
+
+# Per-chat administrator cache for is_admin
+admin_cache = AdminCache(
+    maxsize=int(os.getenv("ADMIN_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("ADMIN_CACHE_TTL", "600"))
+)
+
+# Bio verdicts: profiles are refetched only when a verdict is due for a recheck
+bio_verdicts = BioVerdictCache(
+    profile_cache,
+    clean_recheck=int(os.getenv("BIO_CLEAN_RECHECK", "3600")),
+    flagged_recheck=int(os.getenv("BIO_FLAGGED_RECHECK", "60")),
+    fresh_window=int(os.getenv("BIO_FRESH_WINDOW", "60"))
+)
+
+# Retroactive /scanall member scans
+member_scanner = MemberScanner(
+    bio_verdicts,
+    concurrency=int(os.getenv("SCAN_CONCURRENCY", "8")),
+    rate=float(os.getenv("SCAN_RATE", "20"))
+)
+scan_tasks = set()
+
+register_stats("profile_cache", profile_cache.stats)
+register_stats("bio_verdicts", bio_verdicts.stats)
+register_stats("profile_flight", profile_cache.flight.stats)
+register_stats("admin_cache", admin_cache.stats)
+register_stats("settings_cache", settings_cache.stats)
+register_stats("settings_flight", settings_flight.stats)
+register_stats("warning_store", warning_store.stats)
+register_stats("users_writer", users_writer.stats)
+register_stats("groups_writer", groups_writer.stats)
+register_stats("scheduler", action_scheduler.stats)
+register_stats("ingest", ingest_queue.stats)
+
+startup_timer = StartupTimer()
+register_stats("startup", startup_timer.stats)
+
+async def get_me(client):
+    """Return the bot's own user, fetched once and then served from memory."""
+    if client.me is None:
+        api_calls.inc("get_me")
+        client.me = await client.get_me()
+    return client.me
 
 async def is_admin(client, chat_id, user_id):
+    """Return whether user_id administers chat_id.
+
+    Re-raises FloodWait so callers can ask the user to retry rather than deny
+    a real admin whose admin list could not be fetched.
+    """
     try:
-        async for member in client.get_chat_members(chat_id, filter=enums.ChatMembersFilter.ADMINISTRATORS):
-            if member.user.id == user_id:
-                return True
-        return False
+        return await admin_cache.is_admin(client, chat_id, user_id)
     except errors.FloodWait as e:
-        print(f"WARNING: FloodWait in is_admin: {e}")
-        return False
+        record_flood_wait("get_chat_members", e.value)
+        logger.warning("FloodWait in is_admin chat_id=%s seconds=%s", chat_id, e.value)
+        raise
     except Exception as e:
-        print(f"ERROR: Failed to check admin status: {e}")
+        logger.error("Failed to check admin status chat_id=%s error=%s", chat_id, e)
         return False
 
+def retry_later_text(seconds):
+    return f"⏳ ᴛᴇʟᴇɢʀᴀᴍ ɪꜱ ʀᴀᴛᴇ ʟɪᴍɪᴛɪɴɢ ᴛʜᴇ ʙᴏᴛ. ᴛʀʏ ᴀɢᴀɪɴ ɪɴ {seconds}ꜱ."
+
+async def answer_callback(callback_query, *args, **kwargs):
+    """Answer a callback query; answers are not rate limited per chat, so they skip the scheduler."""
+    api_calls.inc("answer_callback_query")
+    try:
+        return await callback_query.answer(*args, **kwargs)
+    except errors.FloodWait as e:
+        record_flood_wait("answer_callback_query", e.value)
+        raise
+
+@app.on_chat_member_updated(shard_filter)
+@timed("chat_member_updated")
+async def chat_member_updated(client, update):
+    try:
+        admin_cache.apply_member_update(update)
+    except Exception as e:
+        logger.error("Failed in chat_member_updated error=%s", e)
+
+def link_categories(settings):
+    return list(settings.get("link_categories", DEFAULT_CATEGORIES))
+
 async def get_punishment_keyboard(settings):
     """Helper function to generate punishment selection keyboard"""
     current_punishment = settings["punishment"]
+    mentions = CATEGORY_MENTION in link_categories(settings)
     return InlineKeyboardMarkup([
         [InlineKeyboardButton("ᴡᴀʀɴ ⚠️", callback_data="warn")],
         [InlineKeyboardButton("ᴍᴜᴛᴇ 🔇" if current_punishment == "mute" else "ᴍᴜᴛᴇ", callback_data="mute"),
          InlineKeyboardButton("ʙᴀɴ ❌" if current_punishment == "ban" else "ʙᴀɴ", callback_data="ban"),
          InlineKeyboardButton("ᴅᴇʟᴇᴛᴇ 🗑" if current_punishment == "delete" else "ᴅᴇʟᴇᴛᴇ", callback_data="delete")],
+        [InlineKeyboardButton("@ᴍᴇɴᴛɪᴏɴꜱ: ᴏɴ ✅" if mentions else "@ᴍᴇɴᴛɪᴏɴꜱ: ᴏꜰꜰ", callback_data="toggle_mentions")],
         [InlineKeyboardButton("✯ ᴄʟᴏꜱᴇ ✯", callback_data="close")]
     ])
 
@@ -65,11 +162,12 @@ async def get_warning_keyboard(settings):
         [InlineKeyboardButton("ʙᴀᴄᴋ", callback_data="back"), InlineKeyboardButton("✯ ᴄʟᴏsᴇ ✯", callback_data="close")]
     ])
 
-@app.on_message(filters.command("start") & filters.group)
+@app.on_message(filters.command("start") & filters.group & shard_filter)
+@timed("start_group")
 async def start_group(client, message):
     try:
         keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("✨ ꜱᴛᴀʀᴛ ᴍᴇ ɪɴ ᴘʀɪᴠᴀᴛᴇ", url=f"https://t.me/{(await client.get_me()).username}?start=start")]
+            [InlineKeyboardButton("✨ ꜱᴛᴀʀᴛ ᴍᴇ ɪɴ ᴘʀɪᴠᴀᴛᴇ", url=f"https://t.me/{(await get_me(client)).username}?start=start")]
         ])
         
         group_start_message = (
@@ -82,15 +180,18 @@ async def start_group(client, message):
             "ᴄʟɪᴄᴋ ᴛʜᴇ ʙᴜᴛᴛᴏɴ ʙᴇʟᴏᴡ ᴛᴏ ꜱᴛᴀʀᴛ ᴍᴇ ɪɴ ᴘʀɪᴠᴀᴛᴇ ᴛᴏ ꜱᴇᴇ ꜰᴜʟʟ ꜰᴇᴀᴛᴜʀᴇꜱ!"
         )
         
-        await message.reply_text(
+        await action_scheduler.call(
+            message.chat.id, "send_message", message.reply_text,
             group_start_message,
             reply_markup=keyboard,
-            parse_mode=enums.ParseMode.MARKDOWN
+            parse_mode=enums.ParseMode.MARKDOWN,
+            priority=PRIORITY_ADMIN
         )
     except Exception as e:
-        print(f"ERROR: Failed in group start handler: {e}")
+        logger.error("Failed in start_group error=%s", e)
 
-@app.on_message(filters.command("start") & filters.private)
+@app.on_message(filters.command("start") & filters.private & shard_filter)
+@timed("start")
 async def start(client, message):
     try:
         user = message.from_user
@@ -107,56 +208,111 @@ async def start(client, message):
         keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("✨ ᴏᴡɴᴇʀ 🥀", url="https://t.me/JoinIndianNavy_007")],
             [InlineKeyboardButton("ꜱᴜᴘᴘᴏʀᴛ 📣", url="https://t.me/UnfilteredZone")],
-            [InlineKeyboardButton("ᴀᴅᴅ ᴍᴇ ᴛᴏ ʏᴏᴜʀ ɢʀᴏᴜᴘ ➕", url=f"https://t.me/{(await client.get_me()).username}?startgroup=true")]
+            [InlineKeyboardButton("ᴀᴅᴅ ᴍᴇ ᴛᴏ ʏᴏᴜʀ ɢʀᴏᴜᴘ ➕", url=f"https://t.me/{(await get_me(client)).username}?startgroup=true")]
         ])
-        await message.reply_text(start_message, reply_markup=keyboard, parse_mode=enums.ParseMode.HTML)
+        await action_scheduler.call(message.chat.id, "send_message", message.reply_text, start_message, reply_markup=keyboard, parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
     except Exception as e:
-        print(f"ERROR: Failed in start handler: {e}")
+        logger.error("Failed in start error=%s", e)
 
-@app.on_message(filters.group & filters.command("config"))
+@app.on_message(filters.group & filters.command("config") & shard_filter)
+@timed("configure")
 async def configure(client, message):
     try:
         chat_id = message.chat.id
         user_id = message.from_user.id
 
-        if not await is_admin(client, chat_id, user_id):
-            await message.reply_text("<b>❌ ʏᴏᴜ ᴀʀᴇ ɴᴏᴛ ᴀᴅᴍɪɴɪꜱᴛʀᴀᴛᴏʀ</b>", parse_mode=enums.ParseMode.HTML)
-            await message.delete()
+        try:
+            allowed = await is_admin(client, chat_id, user_id)
+        except errors.FloodWait as e:
+            await action_scheduler.call(chat_id, "send_message", message.reply_text, retry_later_text(e.value), priority=PRIORITY_ADMIN)
+            return
+        if not allowed:
+            await action_scheduler.call(chat_id, "send_message", message.reply_text, "<b>❌ ʏᴏᴜ ᴀʀᴇ ɴᴏᴛ ᴀᴅᴍɪɴɪꜱᴛʀᴀᴛᴏʀ</b>", parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
+            await action_scheduler.call(chat_id, "delete_messages", message.delete, priority=PRIORITY_ADMIN)
             return
 
         settings = await get_group_settings(chat_id)
         keyboard = await get_punishment_keyboard(settings)
-        await message.reply_text("<b>ꜱᴇʟᴇᴄᴛ ᴘᴜɴɪꜱʜᴍᴇɴᴛ ꜰᴏʀ ᴜꜱᴇʀꜱ ᴡʜᴏ ʜᴀᴠᴇ ʟɪɴᴋꜱ ɪɴ ᴛʜᴇɪʀ ʙɪᴏ ✨:</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML)
-        await message.delete()
+        await action_scheduler.call(chat_id, "send_message", message.reply_text, "<b>ꜱᴇʟᴇᴄᴛ ᴘᴜɴɪꜱʜᴍᴇɴᴛ ꜰᴏʀ ᴜꜱᴇʀꜱ ᴡʜᴏ ʜᴀᴠᴇ ʟɪɴᴋꜱ ɪɴ ᴛʜᴇɪʀ ʙɪᴏ ✨:</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
+        await action_scheduler.call(chat_id, "delete_messages", message.delete, priority=PRIORITY_ADMIN)
+    except Exception as e:
+        logger.error("Failed in configure error=%s", e)
+
+async def run_member_scan(client, chat_id):
+    try:
+        summary = await member_scanner.run(client, chat_id)
+        resumed = f"\nʀᴇꜱᴜᴍᴇᴅ ᴀꜰᴛᴇʀ {summary.resumed_from} ᴍᴇᴍʙᴇʀꜱ" if summary.resumed_from else ""
+        failed = f"\nᴄᴏᴜʟᴅ ɴᴏᴛ ᴘᴜɴɪꜱʜ: {summary.failed}" if summary.failed else ""
+        await action_scheduler.call(
+            chat_id, "send_message", client.send_message, chat_id,
+            f"<b>✅ ꜱᴄᴀɴ ᴄᴏᴍᴘʟᴇᴛᴇ</b>\nꜱᴄᴀɴɴᴇᴅ: {summary.scanned}\nʟɪɴᴋꜱ ꜰᴏᴜɴᴅ: {summary.flagged}\nꜱᴋɪᴘᴘᴇᴅ: {summary.skipped}{failed}{resumed}",
+            parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN
+        )
     except Exception as e:
-        print(f"ERROR: Failed in config handler: {e}")
+        logger.error("Member scan failed chat_id=%s error=%s", chat_id, e)
+        await action_scheduler.call(chat_id, "send_message", client.send_message, chat_id, "❌ ꜱᴄᴀɴ ꜰᴀɪʟᴇᴅ. ʀᴜɴ /scanall ᴀɢᴀɪɴ ᴛᴏ ʀᴇꜱᴜᴍᴇ.", priority=PRIORITY_ADMIN)
 
-@app.on_callback_query()
+@app.on_message(filters.group & filters.command("scanall") & shard_filter)
+@timed("scan_all")
+async def scan_all(client, message):
+    try:
+        chat_id = message.chat.id
+        user_id = message.from_user.id
+
+        try:
+            allowed = await is_admin(client, chat_id, user_id)
+        except errors.FloodWait as e:
+            await action_scheduler.call(chat_id, "send_message", message.reply_text, retry_later_text(e.value), priority=PRIORITY_ADMIN)
+            return
+        if not allowed:
+            await action_scheduler.call(chat_id, "send_message", message.reply_text, "<b>❌ ʏᴏᴜ ᴀʀᴇ ɴᴏᴛ ᴀᴅᴍɪɴɪꜱᴛʀᴀᴛᴏʀ</b>", parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
+            return
+
+        # Claim the chat before any await so concurrent /scanall commands start one scan
+        if not member_scanner.claim(chat_id):
+            await action_scheduler.call(chat_id, "send_message", message.reply_text, "⏳ ᴀ ꜱᴄᴀɴ ɪꜱ ᴀʟʀᴇᴀᴅʏ ʀᴜɴɴɪɴɢ ɪɴ ᴛʜɪꜱ ɢʀᴏᴜᴘ.", priority=PRIORITY_ADMIN)
+            return
+
+        # Run in the background so this handler returns immediately
+        task = asyncio.ensure_future(run_member_scan(client, chat_id))
+        scan_tasks.add(task)
+        task.add_done_callback(scan_tasks.discard)
+        await action_scheduler.call(chat_id, "send_message", message.reply_text, "🔍 ꜱᴄᴀɴɴɪɴɢ ᴀʟʟ ᴍᴇᴍʙᴇʀ ʙɪᴏꜱ. ɪ'ʟʟ ᴘᴏꜱᴛ ᴀ ꜱᴜᴍᴍᴀʀʏ ᴡʜᴇɴ ᴅᴏɴᴇ.", priority=PRIORITY_ADMIN)
+    except Exception as e:
+        logger.error("Failed in scan_all error=%s", e)
+
+@app.on_callback_query(shard_filter)
+@timed("callback_handler")
 async def callback_handler(client, callback_query):
     try:
         data = callback_query.data
         chat_id = callback_query.message.chat.id
         user_id = callback_query.from_user.id
 
-        if not await is_admin(client, chat_id, user_id):
-            await callback_query.answer("❌ ʏᴏᴜ ᴀʀᴇ ɴᴏᴛ ᴀᴅᴍɪɴɪꜱᴛʀᴀᴛᴏʀ", show_alert=True)
+        try:
+            allowed = await is_admin(client, chat_id, user_id)
+        except errors.FloodWait as e:
+            await answer_callback(callback_query, retry_later_text(e.value), show_alert=True)
+            return
+        if not allowed:
+            await answer_callback(callback_query, "❌ ʏᴏᴜ ᴀʀᴇ ɴᴏᴛ ᴀᴅᴍɪɴɪꜱᴛʀᴀᴛᴏʀ", show_alert=True)
             return
 
         if data == "close":
-            await callback_query.message.delete()
+            await action_scheduler.call(chat_id, "delete_messages", callback_query.message.delete, priority=PRIORITY_ADMIN)
             return
 
         settings = await get_group_settings(chat_id)
 
         if data == "back":
             keyboard = await get_punishment_keyboard(settings)
-            await callback_query.message.edit_text("<b>ꜱᴇʟᴇᴄᴛ ᴘᴜɴɪꜱʜᴍᴇɴᴛ ꜰᴏʀ ᴜꜱᴇʀꜱ ᴡʜᴏ ʜᴀᴠᴇ ʟɪɴᴋꜱ ɪɴ ᴛʜᴇɪʀ ʙɪᴏ✨:</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML)
-            await callback_query.answer()
+            await action_scheduler.call(chat_id, "edit_message_text", callback_query.message.edit_text, "<b>ꜱᴇʟᴇᴄᴛ ᴘᴜɴɪꜱʜᴍᴇɴᴛ ꜰᴏʀ ᴜꜱᴇʀꜱ ᴡʜᴏ ʜᴀᴠᴇ ʟɪɴᴋꜱ ɪɴ ᴛʜᴇɪʀ ʙɪᴏ✨:</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
+            await answer_callback(callback_query)
             return
 
         if data == "warn":
             keyboard = await get_warning_keyboard(settings)
-            await callback_query.message.edit_text("<b>ꜱᴇʟᴇᴄᴛ ᴛʜᴇ ɴᴜᴍʙᴇʀ ᴏꜰ ᴡᴀʀɴɪɴɢꜱ ʙᴇꜰᴏʀᴇ ᴘᴜɴɪꜱʜᴍᴇɴᴛ:</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML)
+            await action_scheduler.call(chat_id, "edit_message_text", callback_query.message.edit_text, "<b>ꜱᴇʟᴇᴄᴛ ᴛʜᴇ ɴᴜᴍʙᴇʀ ᴏꜰ ᴡᴀʀɴɪɴɢꜱ ʙᴇꜰᴏʀᴇ ᴘᴜɴɪꜱʜᴍᴇɴᴛ:</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
             return
 
         if data in ["mute", "ban", "delete"]:
@@ -164,78 +320,164 @@ async def callback_handler(client, callback_query):
             settings["punishment"] = data
             await update_group_settings(chat_id, settings)
             keyboard = await get_punishment_keyboard(settings)
-            await callback_query.message.edit_text("<b>ᴘᴜɴɪꜱʜᴍᴇɴᴛ ꜱᴇʟᴇᴄᴛᴇᴅ:</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML)
-            await callback_query.answer()
+            await action_scheduler.call(chat_id, "edit_message_text", callback_query.message.edit_text, "<b>ᴘᴜɴɪꜱʜᴍᴇɴᴛ ꜱᴇʟᴇᴄᴛᴇᴅ:</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
+            await answer_callback(callback_query)
+        elif data == "toggle_mentions":
+            # Flag bios that advertise an @channel or @user handle
+            categories = link_categories(settings)
+            if CATEGORY_MENTION in categories:
+                categories.remove(CATEGORY_MENTION)
+            else:
+                categories.append(CATEGORY_MENTION)
+            settings["link_categories"] = categories
+            await update_group_settings(chat_id, settings)
+            keyboard = await get_punishment_keyboard(settings)
+            state = "ᴏɴ" if CATEGORY_MENTION in categories else "ᴏꜰꜰ"
+            await action_scheduler.call(chat_id, "edit_message_text", callback_query.message.edit_text, f"<b>@ᴍᴇɴᴛɪᴏɴ ᴅᴇᴛᴇᴄᴛɪᴏɴ {state}</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
+            await answer_callback(callback_query)
         elif data.startswith("warn_"):
             num_warnings = int(data.split("_")[1])
             settings["type"] = "warn"
             settings["warning_limit"] = num_warnings
             await update_group_settings(chat_id, settings)
             keyboard = await get_warning_keyboard(settings)
-            await callback_query.message.edit_text(f"<b>ᴡᴀʀɴɪɴɢ ʟɪᴍɪᴛ ꜱᴇᴛ ᴛᴏ {num_warnings}</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML)
-            await callback_query.answer()
+            await action_scheduler.call(chat_id, "edit_message_text", callback_query.message.edit_text, f"<b>ᴡᴀʀɴɪɴɢ ʟɪᴍɪᴛ ꜱᴇᴛ ᴛᴏ {num_warnings}</b>", reply_markup=keyboard, parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
+            await answer_callback(callback_query)
         elif data.startswith("unmute_"):
             target_user_id = int(data.split("_")[1])
-            target_user = await client.get_chat(target_user_id)
-            target_user_name = f"{target_user.first_name} {target_user.last_name}" if target_user.last_name else target_user.first_name
+            target_user = await profile_cache.fetch(client, target_user_id)
+            target_user_name = target_user.full_name
             try:
-                await client.restrict_chat_member(chat_id, target_user_id, ChatPermissions(can_send_messages=True))
-                await callback_query.message.edit_text(f"{target_user_name} [<code>{target_user_id}</code>] has been unmuted", parse_mode=enums.ParseMode.HTML)
+                await action_scheduler.call(chat_id, "restrict_chat_member", client.restrict_chat_member, chat_id, target_user_id, ChatPermissions(can_send_messages=True), priority=PRIORITY_ADMIN)
+                action_scheduler.forget_punishment("mute", chat_id, target_user_id)
+                await action_scheduler.call(chat_id, "edit_message_text", callback_query.message.edit_text, f"{target_user_name} [<code>{target_user_id}</code>] has been unmuted", parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
             except errors.ChatAdminRequired:
-                await callback_query.message.edit_text("ɪ ᴅᴏɴ'ᴛ ʜᴀᴠᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ ᴛᴏ ᴜɴᴍᴜᴛᴇ ᴜꜱᴇʀꜱ 🥺")
-            await callback_query.answer()
+                await action_scheduler.call(chat_id, "edit_message_text", callback_query.message.edit_text, "ɪ ᴅᴏɴ'ᴛ ʜᴀᴠᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ ᴛᴏ ᴜɴᴍᴜᴛᴇ ᴜꜱᴇʀꜱ 🥺", priority=PRIORITY_ADMIN)
+            await answer_callback(callback_query)
         elif data.startswith("unban_"):
             target_user_id = int(data.split("_")[1])
-            target_user = await client.get_chat(target_user_id)
-            target_user_name = f"{target_user.first_name} {target_user.last_name}" if target_user.last_name else target_user.first_name
+            target_user = await profile_cache.fetch(client, target_user_id)
+            target_user_name = target_user.full_name
             try:
-                await client.unban_chat_member(chat_id, target_user_id)
-                await callback_query.message.edit_text(f"{target_user_name} [<code>{target_user_id}</code>] has been unbanned", parse_mode=enums.ParseMode.HTML)
+                await action_scheduler.call(chat_id, "unban_chat_member", client.unban_chat_member, chat_id, target_user_id, priority=PRIORITY_ADMIN)
+                action_scheduler.forget_punishment("ban", chat_id, target_user_id)
+                await action_scheduler.call(chat_id, "edit_message_text", callback_query.message.edit_text, f"{target_user_name} [<code>{target_user_id}</code>] has been unbanned", parse_mode=enums.ParseMode.HTML, priority=PRIORITY_ADMIN)
             except errors.ChatAdminRequired:
-                await callback_query.message.edit_text("ɪ ᴅᴏɴ'ᴛ ʜᴀᴠᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ ᴛᴏ ᴜɴʙᴀɴ ᴜꜱᴇʀꜱ 🥺")
-            await callback_query.answer()
+                await action_scheduler.call(chat_id, "edit_message_text", callback_query.message.edit_text, "ɪ ᴅᴏɴ'ᴛ ʜᴀᴠᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ ᴛᴏ ᴜɴʙᴀɴ ᴜꜱᴇʀꜱ 🥺", priority=PRIORITY_ADMIN)
+            await answer_callback(callback_query)
     except Exception as e:
-        print(f"ERROR: Failed in callback_handler: {e}")
-        await callback_query.answer("An error occurred", show_alert=True)
+        logger.error("Failed in callback_handler error=%s", e)
+        await answer_callback(callback_query, "An error occurred", show_alert=True)
 
-@app.on_message(filters.group & filters.new_chat_members)
+@app.on_message(filters.group & filters.new_chat_members & shard_filter)
+@timed("bot_added_to_group")
 async def bot_added_to_group(client, message):
     try:
         chat_id = message.chat.id
-        bot_id = (await client.get_me()).id
+        bot_id = (await get_me(client)).id
         for member in message.new_chat_members:
             if member.id == bot_id:
-                settings = await get_group_settings(chat_id)
-                await update_group_settings(chat_id, settings)
-                await message.reply_text("ᴛʜᴀɴᴋ ʏᴏᴜ ꜰᴏʀ ᴀᴅᴅɪɴɢ ᴍᴇ! ɪ'ʟʟ ᴍᴏɴɪᴛᴏʀ ᴜꜱᴇʀ ʙɪᴏꜱ ꜰᴏʀ ʟɪɴᴋꜱ. ᴀᴅᴍɪɴꜱ ᴄᴀɴ ᴄᴏɴꜰɪɢᴜʀᴇ ᴘᴜɴɪꜱʜᴍᴇɴᴛꜱ ᴡɪᴛʜ /config")
+                await ensure_group_settings(chat_id)
+                await action_scheduler.call(chat_id, "send_message", message.reply_text, "ᴛʜᴀɴᴋ ʏᴏᴜ ꜰᴏʀ ᴀᴅᴅɪɴɢ ᴍᴇ! ɪ'ʟʟ ᴍᴏɴɪᴛᴏʀ ᴜꜱᴇʀ ʙɪᴏꜱ ꜰᴏʀ ʟɪɴᴋꜱ. ᴀᴅᴍɪɴꜱ ᴄᴀɴ ᴄᴏɴꜰɪɢᴜʀᴇ ᴘᴜɴɪꜱʜᴍᴇɴᴛꜱ ᴡɪᴛʜ /config", priority=PRIORITY_ADMIN)
+            elif not member.is_bot:
+                # Scan new members ahead of message checks so their first
+                # message is served from a fresh verdict
+                ingest_queue.submit(chat_id, functools.partial(scan_new_members, client, chat_id), member.id,
+                                    priority=PRIORITY_JOIN, merge_key=("join", chat_id))
     except Exception as e:
-        print(f"ERROR: Failed in bot_added_to_group: {e}")
+        logger.error("Failed in bot_added_to_group error=%s", e)
+
+@timed("scan_new_members")
+async def scan_new_members(client, chat_id, user_ids):
+    for result in await asyncio.gather(*(bio_verdicts.scan(client, user_id, chat_id) for user_id in user_ids), return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.warning("Failed to scan new member chat_id=%s error=%s", chat_id, result)
 
-@app.on_message(filters.group)
+@app.on_message(filters.group & shard_filter)
+@timed("check_bio")
 async def check_bio(client, message):
     try:
         chat_id = message.chat.id
         user_id = message.from_user.id
+        # Queued messages from the same user in the same chat share one check
+        ingest_queue.submit(chat_id, functools.partial(check_messages, client), message, merge_key=(chat_id, user_id))
+    except Exception as e:
+        logger.error("Failed in check_bio error=%s", e)
 
-        user_full = await client.get_chat(user_id)
-        bio = user_full.bio if user_full.bio else ""
-        if user_full.username:
-            user_name = f"@{user_full.username} [<code>{user_id}</code>]"
-        else:
-            user_name = f"{user_full.first_name} {user_full.last_name} [<code>{user_id}</code>]" if user_full.last_name else f"{user_full.first_name} [<code>{user_id}</code>]"
+@timed("check_messages")
+async def check_messages(client, messages):
+    """Check the bio of the sender of messages, all sent by one user in one chat."""
+    try:
+        message = messages[-1]
+        chat_id = message.chat.id
+        user_id = message.from_user.id
+
+        verdict = await bio_verdicts.check(client, user_id, message.from_user, chat_id)
+        user_full = verdict.profile
+        bio = user_full.bio
+        user_name = user_full.display_name
 
         settings = await get_group_settings(chat_id)
-        await apply_punishment(client, message, user_id, user_name, bio, settings)
+        punish = apply_punishment(client, message, user_id, user_name, bio, settings)
+        if len(messages) > 1 and has_link(bio, settings):
+            # Warn once for the latest message and delete the earlier ones with it
+            deletes = [action_scheduler.delete(client, chat_id, earlier.id) for earlier in messages[:-1]]
+            results = await asyncio.gather(punish, *deletes, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.warning("Failed to handle merged messages chat_id=%s error=%s", chat_id, result)
+        else:
+            await punish
     except Exception as e:
-        print(f"ERROR: Failed in check_bio: {e}")
+        logger.error("Failed in check_messages error=%s", e)
+
+async def main():
+    # With more than one shard, hold this shard's lease before taking updates
+    lease = ShardLease(shard_id, ttl=int(os.getenv("SHARD_LEASE_TTL", "30"))) if shard_count > 1 else None
+    if lease:
+        await startup_timer.run("mongo", connect())
+        await startup_timer.run("lease", lease.acquire())
+        await startup_timer.run("telegram", app.start())
+    else:
+        await startup_timer.run_concurrently(mongo=connect(), telegram=app.start())
+    # Client.start() already fetched our identity; this only fills it if not
+    await startup_timer.run("identity", get_me(app))
+    start_settings_watcher(asyncio.get_running_loop())
+    # Shard workers on one host each listen on METRICS_PORT + SHARD_ID
+    metrics_port = int(os.getenv("METRICS_PORT", "9464"))
+    await startup_timer.run("metrics", start_metrics_server(port=metrics_port + shard_id if metrics_port else 0))
+    startup_timer.finish()
+    waiters = [asyncio.ensure_future(idle())]
+    if lease:
+        waiters.append(asyncio.ensure_future(lease.heartbeat()))
+    done, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    # Running /scanall scans resume from their last checkpoint after restart
+    for task in scan_tasks:
+        task.cancel()
+    await asyncio.gather(*scan_tasks, return_exceptions=True)
+    # Queued checks and actions need a running client, so drain them first;
+    # the Mongo writers only need the database and flush last
+    await ingest_queue.close()
+    await action_scheduler.close()
+    await app.stop()
+    await warning_store.close()
+    await users_writer.close()
+    await groups_writer.close()
+    if lease:
+        await lease.release()
+    for task in done:
+        # Re-raise LeaseLost so the launcher restarts this worker
+        task.result()
 
 if __name__ == "__main__":
-    print("DEBUG: Starting bot...")
+    logger.debug("Starting bot")
     try:
-        app.run()
+        app.run(main())
     except errors.AuthKeyUnregistered:
-        print("ERROR: Invalid API_ID, API_HASH, or BOT_TOKEN. Please verify credentials.")
+        logger.error("Invalid API_ID, API_HASH, or BOT_TOKEN. Please verify credentials.")
         exit(1)
     except Exception as e:
-        print(f"ERROR: Failed to start bot: {str(e)}")
+        logger.error("Failed to start bot error=%s", e)
         exit(1)
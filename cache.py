@@ -0,0 +1,163 @@
+from collections import OrderedDict
+from singleflight import SingleFlight
+from pyrogram import errors
+from metrics import api_calls, record_flood_wait
+import time
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key when full."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        """Return the value for key and mark it as recently used."""
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def peek(self, key, default=None):
+        """Return the value for key without touching LRU order."""
+        return self._data.get(key, default)
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entry if full."""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop key from the cache if present."""
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+class TTLCache(LRUCache):
+    """Bounded LRU cache whose entries expire after a fixed TTL."""
+
+    def __init__(self, maxsize=10000, ttl=300):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired."""
+        entry = super().get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            self.invalidate(key)
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def peek(self, key, default=None):
+        """Return the stored value for key without touching LRU order or counters."""
+        entry = super().peek(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entry if full."""
+        super().set(key, (value, time.monotonic() + self.ttl))
+
+    def __contains__(self, key):
+        entry = super().peek(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+class UserProfile:
+    """The subset of a user's profile the bot needs for bio checks."""
+    __slots__ = ("user_id", "bio", "username", "first_name", "last_name")
+
+    def __init__(self, user_id, bio, username, first_name, last_name):
+        self.user_id = user_id
+        self.bio = bio
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+
+    @classmethod
+    def from_chat(cls, chat):
+        return cls(chat.id, chat.bio or "", chat.username, chat.first_name, chat.last_name)
+
+    @property
+    def full_name(self):
+        return f"{self.first_name} {self.last_name}" if self.last_name else self.first_name
+
+    @property
+    def display_name(self):
+        """HTML name used in punishment notices."""
+        if self.username:
+            return f"@{self.username} [<code>{self.user_id}</code>]"
+        return f"{self.full_name} [<code>{self.user_id}</code>]"
+
+    def matches(self, user):
+        """Check whether a message's from_user still has the names we cached."""
+        return (
+            self.username == user.username
+            and self.first_name == user.first_name
+            and self.last_name == user.last_name
+        )
+
+class UserProfileCache(TTLCache):
+    """TTL/LRU cache of user profiles in front of client.get_chat.
+
+    Concurrent misses for the same user share a single get_chat call.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        super().__init__(maxsize, ttl)
+        self.flight = SingleFlight()
+
+    async def _load(self, client, user_id):
+        api_calls.inc("get_chat")
+        try:
+            chat = await client.get_chat(user_id)
+        except errors.FloodWait as e:
+            record_flood_wait("get_chat", e.value)
+            raise
+        profile = UserProfile.from_chat(chat)
+        self.set(user_id, profile)
+        return profile
+
+    async def fetch(self, client, user_id, user=None, refresh=False):
+        """Return the cached profile for user_id, fetching it on a miss.
+
+        If user (a message's from_user) is given and its names differ from the
+        cached entry, the entry is treated as stale and refetched. refresh=True
+        always refetches.
+        """
+        if refresh:
+            self.invalidate(user_id)
+        profile = self.get(user_id)
+        if profile is not None and user is not None and not profile.matches(user):
+            self.invalidate(user_id)
+            self.hits -= 1
+            self.misses += 1
+            profile = None
+        if profile is None:
+            profile = await self.flight.do(user_id, self._load, client, user_id)
+        return profile
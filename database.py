@@ -1,9 +1,22 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from bson import Int64
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import asyncio
+import functools
+import logging
 import os
+import re
+import time
 import pymongo.errors
+import threading
+from cache import TTLCache
+from singleflight import SingleFlight
+from metrics import mongo_latency
+from write_behind import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,79 +24,202 @@ load_dotenv()
 # MongoDB setup
 mongo_uri = os.getenv("MONGO_URI")
 if not mongo_uri:
-    print("ERROR: MONGO_URI not found in .env file")
+    logger.error("MONGO_URI not found in .env file")
     raise ValueError("MONGO_URI is required")
 
-print(f"DEBUG: Connecting to MongoDB with URI: {mongo_uri}")
+# Connection pool and timeouts (milliseconds)
+mongo_pool_size = int(os.getenv("MONGO_POOL_SIZE", "20"))
+mongo_min_pool_size = min(int(os.getenv("MONGO_MIN_POOL_SIZE", "4")), mongo_pool_size)
+mongo_timeout_ms = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
 
+# MongoClient connects in the background, so importing this module never
+# blocks; connect() checks reachability and warms the pool at startup.
 try:
-    mongo_client = MongoClient(mongo_uri)
-    # Test connection
-    mongo_client.server_info()  # Raises ConnectionFailure if unreachable
-    print("DEBUG: MongoDB connection successful")
-except pymongo.errors.ConnectionFailure as e:
-    print(f"ERROR: Failed to connect to MongoDB: {str(e)}")
-    raise
+    mongo_client = MongoClient(
+        mongo_uri,
+        maxPoolSize=mongo_pool_size,
+        minPoolSize=mongo_min_pool_size,
+        serverSelectionTimeoutMS=mongo_timeout_ms,
+        connectTimeoutMS=mongo_timeout_ms,
+        socketTimeoutMS=mongo_timeout_ms
+    )
 except pymongo.errors.ConfigurationError as e:
-    print(f"ERROR: Invalid MongoDB URI: {str(e)}")
+    logger.error("Invalid MongoDB URI error=%s", e)
     raise
 
 db = mongo_client["telegram_bot"]
 groups_collection = db["groups"]
 users_collection = db["users"]
 
+# pymongo is synchronous, so every call runs on a bounded thread pool sized to
+# the connection pool to keep the event loop free while waiting on MongoDB.
+mongo_executor = ThreadPoolExecutor(max_workers=mongo_pool_size, thread_name_prefix="mongo")
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking pymongo call on the MongoDB executor."""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(mongo_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        mongo_latency.observe(time.perf_counter() - start, func.__name__)
+
+async def connect():
+    """Ping MongoDB and open mongo_min_pool_size connections and executor threads.
+
+    Each ping is bounded by MONGO_TIMEOUT_MS. Raises ConnectionFailure if the
+    server is unreachable.
+    """
+    logger.debug("Connecting to MongoDB uri=%s", re.sub(r"//[^/@]+@", "//***@", mongo_uri))
+    try:
+        await run_db(mongo_client.admin.command, "ping")
+        # Concurrent pings run on separate executor threads, each checking out its own connection
+        await asyncio.gather(*(run_db(mongo_client.admin.command, "ping") for _ in range(mongo_min_pool_size - 1)))
+    except pymongo.errors.ConnectionFailure as e:
+        logger.error("Failed to connect to MongoDB error=%s", e)
+        raise
+    logger.debug("MongoDB connection successful warm_connections=%s", mongo_min_pool_size)
+    await ensure_indexes()
+
+async def ensure_indexes():
+    """Index groups by chat_id and users by user_id, the keys every upsert filters on."""
+    for collection, field in ((groups_collection, "chat_id"), (users_collection, "user_id")):
+        try:
+            await run_db(collection.create_index, field, unique=True)
+        except pymongo.errors.OperationFailure as e:
+            # Existing duplicate documents block a unique index; index anyway so lookups stay fast
+            logger.warning("Could not create unique index collection=%s field=%s error=%s", collection.name, field, e)
+            await run_db(collection.create_index, field)
+
+# Upserts that need not be visible immediately are coalesced per key and
+# written in batches; see write_behind.py
+write_behind_interval = float(os.getenv("WRITE_BEHIND_INTERVAL", "2"))
+write_behind_batch = int(os.getenv("WRITE_BEHIND_BATCH", "500"))
+users_writer = WriteBehindQueue(users_collection, run_db, flush_interval=write_behind_interval, flush_batch=write_behind_batch)
+groups_writer = WriteBehindQueue(groups_collection, run_db, flush_interval=write_behind_interval, flush_batch=write_behind_batch)
+
 default_warning_limit = 3
 default_punishment = "mute"
 default_punishment_set = {"type": "warn", "warning_limit": default_warning_limit, "punishment": default_punishment}
 
+# Per-chat settings cache. Entries hold (settings, version); the TTL bounds how
+# stale a chat can get when another process writes without a change stream.
+settings_cache = TTLCache(
+    maxsize=int(os.getenv("SETTINGS_CACHE_SIZE", "50000")),
+    ttl=int(os.getenv("SETTINGS_CACHE_TTL", "600"))
+)
+
+# Optional per-chat link detection settings, see link_detector.py
+optional_setting_keys = ["allowed_domains", "denied_domains", "link_categories"]
+
+def _settings_from_doc(group):
+    settings = {
+        "type": group.get("type", "warn"),
+        "warning_limit": group.get("warning_limit", default_warning_limit),
+        "punishment": group.get("punishment", default_punishment)
+    }
+    for key in optional_setting_keys:
+        if key in group:
+            settings[key] = list(group[key])
+    return settings
+
+# Concurrent cache misses for the same chat share one find_one
+settings_flight = SingleFlight()
+
+async def _load_group_settings(chat_id):
+    group = await run_db(groups_collection.find_one, {"chat_id": Int64(chat_id)})
+    if group:
+        settings = _settings_from_doc(group)
+        version = group.get("version", 0)
+    else:
+        settings = dict(default_punishment_set)
+        version = 0
+    settings_cache.set(chat_id, (settings, version))
+    return settings
+
 async def get_group_settings(chat_id):
-    """Retrieve group settings from MongoDB, or return default if not found."""
+    """Retrieve group settings from cache or MongoDB, or return default if not found."""
+    cached = settings_cache.get(chat_id)
+    if cached is not None:
+        return dict(cached[0])
     try:
-        group = groups_collection.find_one({"chat_id": Int64(chat_id)})
-        if group:
-            return {
-                "type": group.get("type", "warn"),
-                "warning_limit": group.get("warning_limit", default_warning_limit),
-                "punishment": group.get("punishment", default_punishment)
-            }
-        return default_punishment_set
+        settings = await settings_flight.do(chat_id, _load_group_settings, chat_id)
+        return dict(settings)
     except pymongo.errors.PyMongoError as e:
-        print(f"ERROR: Failed to get group settings for chat_id {chat_id}: {str(e)}")
-        return default_punishment_set
+        logger.error("Failed to get group settings chat_id=%s error=%s", chat_id, e)
+        return dict(default_punishment_set)
+
+async def ensure_group_settings(chat_id):
+    """Queue a write of the default settings for chat_id unless it already has some."""
+    groups_writer.put({"chat_id": Int64(chat_id)}, set_on_insert=dict(default_punishment_set))
 
 async def update_group_settings(chat_id, settings):
-    """Update group settings in MongoDB."""
+    """Update group settings in MongoDB and write them through to the cache.
+
+    Writes are synchronous so other processes see them at once. Settings equal
+    to the cached copy of a stored document are not written again.
+    """
     required_keys = ["type", "warning_limit", "punishment"]
     if not all(key in settings for key in required_keys):
-        print(f"ERROR: Settings missing required keys: {required_keys}")
+        logger.error("Settings missing required keys keys=%s", required_keys)
+        return
+
+    update = {
+        "chat_id": Int64(chat_id),
+        "type": settings["type"],
+        "warning_limit": settings["warning_limit"],
+        "punishment": settings["punishment"]
+    }
+    for key in optional_setting_keys:
+        if key in settings:
+            update[key] = list(settings[key])
+
+    cached = settings_cache.peek(chat_id)
+    if cached is not None and cached[1] > 0 and cached[0] == _settings_from_doc(update):
+        logger.debug("Settings unchanged chat_id=%s", chat_id)
         return
 
     try:
-        groups_collection.update_one(
+        group = await run_db(
+            groups_collection.find_one_and_update,
             {"chat_id": Int64(chat_id)},
-            {"$set": {
-                "chat_id": Int64(chat_id),
-                "type": settings["type"],
-                "warning_limit": settings["warning_limit"],
-                "punishment": settings["punishment"]
-            }},
-            upsert=True
+            {"$set": update, "$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
-        print(f"DEBUG: Updated settings for chat_id {chat_id}")
+        settings_cache.set(chat_id, (_settings_from_doc(group), group.get("version", 0)))
+        logger.debug("Updated settings chat_id=%s", chat_id)
     except pymongo.errors.PyMongoError as e:
-        print(f"ERROR: Failed to update group settings for chat_id {chat_id}: {str(e)}")
+        settings_cache.invalidate(chat_id)
+        logger.error("Failed to update group settings chat_id=%s error=%s", chat_id, e)
 
-async def store_user(user_id):
-    """Store a user who started the bot in MongoDB."""
+def _invalidate_if_newer(chat_id, version):
+    cached = settings_cache.peek(chat_id)
+    if cached is not None and cached[1] < version:
+        settings_cache.invalidate(chat_id)
+
+def _watch_group_settings(loop):
     try:
-        users_collection.update_one(
-            {"user_id": Int64(user_id)},
-            {"$set": {
-                "user_id": Int64(user_id),
-                "started_at": datetime.utcnow()
-            }},
-            upsert=True
-        )
-        print(f"DEBUG: Stored user_id {user_id}")
+        with groups_collection.watch(full_document="updateLookup") as stream:
+            for change in stream:
+                group = change.get("fullDocument")
+                if not group or "chat_id" not in group:
+                    continue
+                loop.call_soon_threadsafe(_invalidate_if_newer, int(group["chat_id"]), group.get("version", 0))
     except pymongo.errors.PyMongoError as e:
-        print(f"ERROR: Failed to store user_id {user_id}: {str(e)}")
+        logger.warning("Settings change stream stopped, relying on cache TTL error=%s", e)
+
+def start_settings_watcher(loop):
+    """Invalidate cached settings written by other bot processes.
+
+    Needs a replica set or sharded cluster; on a standalone server the watcher
+    logs a warning and exits, and the cache TTL bounds staleness instead.
+    """
+    thread = threading.Thread(target=_watch_group_settings, args=(loop,), name="settings-watcher", daemon=True)
+    thread.start()
+    return thread
+
+async def store_user(user_id):
+    """Queue a write of a user who started the bot; started_at records the first /start."""
+    users_writer.put({"user_id": Int64(user_id)}, set_on_insert={"started_at": datetime.utcnow()})
+    logger.debug("Queued user user_id=%s", user_id)
@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers run first
+PRIORITY_JOIN = 0   # bio scans of members who just joined
+PRIORITY_CHECK = 1  # bio checks for group messages
+
+class _Job:
+    __slots__ = ("chat_id", "func", "merge_key", "items")
+
+    def __init__(self, chat_id, func, merge_key, item):
+        self.chat_id = chat_id
+        self.func = func
+        self.merge_key = merge_key
+        self.items = [item]
+
+class IngestQueue:
+    """Bounded, prioritised queue of incoming work, run by a fixed pool of workers.
+
+    submit() returns at once, so Pyrogram's dispatcher is never held up by bio
+    checks and admin commands and callbacks are handled as soon as they
+    arrive. Jobs run as func(items) in priority order. A job submitted with the
+    merge_key of one still queued is merged into it, so e.g. a burst of
+    messages from one user costs a single check. At most max_per_chat jobs per
+    chat and max_queued in total wait in the queue, and a job merges at most
+    max_items items; anything beyond that is dropped and counted.
+    """
+
+    def __init__(self, workers=16, max_queued=10000, max_per_chat=200, max_items=100):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_chat = max_per_chat
+        self.max_items = max_items
+        self.processed = 0
+        self.merged = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = None
+        self._seq = itertools.count()
+        self._workers = []
+        self._pending = {}
+        self._chat_depth = {}
+        self._closing = False
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if not self._workers:
+            self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    def depth(self, chat_id=None):
+        """Jobs waiting in the queue, overall or for chat_id."""
+        if chat_id is None:
+            return self._queue.qsize() if self._queue is not None else 0
+        return self._chat_depth.get(chat_id, 0)
+
+    def submit(self, chat_id, func, item, priority=PRIORITY_CHECK, merge_key=None):
+        """Queue item for func; return False if it was dropped."""
+        if self._closing:
+            self.dropped += 1
+            return False
+        job = self._pending.get(merge_key) if merge_key is not None else None
+        if job is not None:
+            if len(job.items) >= self.max_items:
+                self.dropped += 1
+                return False
+            job.items.append(item)
+            self.merged += 1
+            return True
+        if self.depth() >= self.max_queued or self.depth(chat_id) >= self.max_per_chat:
+            self.dropped += 1
+            logger.debug("Dropped ingest job chat_id=%s depth=%s chat_depth=%s", chat_id, self.depth(), self.depth(chat_id))
+            return False
+        self._ensure_workers()
+        job = _Job(chat_id, func, merge_key, item)
+        if merge_key is not None:
+            self._pending[merge_key] = job
+        self._chat_depth[chat_id] = self._chat_depth.get(chat_id, 0) + 1
+        self._queue.put_nowait((priority, next(self._seq), job))
+        return True
+
+    def _dequeued(self, job):
+        if job.merge_key is not None and self._pending.get(job.merge_key) is job:
+            # Items arriving from now on start a new job
+            del self._pending[job.merge_key]
+        depth = self._chat_depth.get(job.chat_id, 0) - 1
+        if depth > 0:
+            self._chat_depth[job.chat_id] = depth
+        else:
+            self._chat_depth.pop(job.chat_id, None)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            self._dequeued(job)
+            try:
+                await job.func(job.items)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Ingest job failed chat_id=%s error=%s", job.chat_id, e)
+            finally:
+                self._queue.task_done()
+
+    async def join(self):
+        """Wait until every queued job has run."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        """Stop accepting jobs, run the ones already queued and stop the workers."""
+        self._closing = True
+        await self.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self):
+        return {
+            "queued": self.depth(),
+            "chats": len(self._chat_depth),
+            "processed": self.processed,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+ingest_queue = IngestQueue(
+    workers=int(os.getenv("INGEST_WORKERS", "16")),
+    max_queued=int(os.getenv("INGEST_MAX_QUEUED", "10000")),
+    max_per_chat=int(os.getenv("INGEST_CHAT_QUEUED", "200"))
+)
@@ -0,0 +1,86 @@
+"""Run the bot as several shard workers and restart any that exit.
+
+Usage:
+
+    python launcher.py [--shards N]
+
+Each worker runs bot.py with SHARD_ID and SHARD_COUNT set and handles only
+the chats that hash to its shard (see sharding.py).
+"""
+import log
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger("launcher")
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+class Supervisor:
+    """Keep one bot.py process per shard alive, restarting with backoff."""
+
+    def __init__(self, shard_count, min_backoff=1, max_backoff=60, stable_after=60):
+        self.shard_count = shard_count
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.restarts = [0] * shard_count
+        self._processes = {}
+        self._stopping = False
+
+    async def _spawn(self, shard_id):
+        env = dict(
+            os.environ,
+            SHARD_ID=str(shard_id),
+            SHARD_COUNT=str(self.shard_count),
+            SHARD_OWNER=f"{socket.gethostname()}:{os.getpid()}:shard{shard_id}"
+        )
+        process = await asyncio.create_subprocess_exec(sys.executable, BOT_PATH, env=env)
+        self._processes[shard_id] = process
+        logger.info("Started worker shard_id=%s pid=%s", shard_id, process.pid)
+        return process
+
+    async def _supervise(self, shard_id):
+        backoff = self.min_backoff
+        while not self._stopping:
+            started_at = time.monotonic()
+            process = await self._spawn(shard_id)
+            returncode = await process.wait()
+            if self._stopping:
+                break
+            self.restarts[shard_id] += 1
+            if time.monotonic() - started_at > self.stable_after:
+                backoff = self.min_backoff
+            logger.warning("Worker exited shard_id=%s returncode=%s restart_in=%s", shard_id, returncode, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def stop(self):
+        self._stopping = True
+        for process in self._processes.values():
+            if process.returncode is None:
+                process.terminate()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+        await asyncio.gather(*(self._supervise(shard_id) for shard_id in range(self.shard_count)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Run and supervise sharded bot workers")
+    parser.add_argument("--shards", type=int, default=int(os.getenv("SHARD_COUNT", "2")), help="number of worker processes")
+    args = parser.parse_args()
+    asyncio.run(Supervisor(args.shards).run())
+
+if __name__ == "__main__":
+    main()
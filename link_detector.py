@@ -0,0 +1,198 @@
+from cache import LRUCache
+import hashlib
+import re
+import unicodedata
+
+# Detection categories that can be enabled per chat
+CATEGORY_URL = "url"            # http://, https://, www.
+CATEGORY_TELEGRAM = "telegram"  # t.me/x, telegram.me/x, tg://
+CATEGORY_DOMAIN = "domain"      # bare domains such as example.com
+CATEGORY_MENTION = "mention"    # @channel handles
+ALL_CATEGORIES = (CATEGORY_URL, CATEGORY_TELEGRAM, CATEGORY_DOMAIN, CATEGORY_MENTION)
+DEFAULT_CATEGORIES = (CATEGORY_URL, CATEGORY_TELEGRAM, CATEGORY_DOMAIN)
+
+TLDS = frozenset("""
+com net org info biz io co me app dev xyz online site store shop tech club live
+pro top vip link click space website fun icu buzz cc tv ws gg ly to fm am im sh
+gl ai so ac la mobi name asia tel travel jobs news blog cloud digital email world
+life today media chat social network group zone one page wiki art agency money
+bet casino win games game porn sex adult xxx cam tube
+us uk ca au de fr it es nl be ch at se no dk fi pl pt ie cz sk hu ro bg gr tr
+ru ua by kz uz ir iq sa ae qa kw om bh jo lb il eg ma dz tn ng ke za gh
+in pk bd lk np cn jp kr tw hk sg my id th vn ph mm kh
+br ar cl mx pe ve uy py bo ec nz eu su
+""".split())
+
+# TLDs that are also common English words. "life.Be happy" or "me.it" is far
+# more often a missing space than a domain, so without a scheme these only
+# count with a subdomain or a path (shop.example.in, earn.in/ref).
+WORD_TLDS = frozenset("am at be by id in is it me my no so to us".split())
+
+# TLDs spelled out as "example dot com"
+SPELLED_TLDS = "com|net|org|info|biz|xyz|io|ru"
+
+TELEGRAM_HOSTS = ("t.me", "telegram.me", "telegram.dog")
+
+# Common link obfuscations, applied after NFKC normalisation; case is kept so
+# bare domains can be told apart from sentences. Patterns with a needle only
+# run on bios containing it.
+_DEOBFUSCATIONS = (
+    (None, re.compile(r"h(?:xx|\*\*)p(s?)", re.I), r"http\1"),
+    (None, re.compile(r"\s*[\[\(\{<]\s*(?:\.|dot)\s*[\]\)\}>]\s*", re.I), "."),
+    ("dot", re.compile(r"\s+dot\s+(?=(?:" + SPELLED_TLDS + r")\b)", re.I), "."),
+    ("dot", re.compile(r"\b(t|telegram)\s+dot\s+(me|dog)\b", re.I), r"\1.\2"),
+    (None, re.compile(r"\[\s*:\s*\]"), ":"),
+)
+
+# Linear-time tokenizers: no nested quantifiers, so no catastrophic backtracking
+_TG_SCHEME_RE = re.compile(r"tg://", re.I)
+_HOST_RE = re.compile(r"(?<![\w@.-])[a-z0-9](?:[a-z0-9-]*[a-z0-9])?(?:\.[a-z0-9](?:[a-z0-9-]*[a-z0-9])?)+", re.I)
+_MENTION_RE = re.compile(r"(?<![\w@])@([a-z][a-z0-9_]{3,31})", re.I)
+_WORD_AFTER_RE = re.compile(r"\s+\w")
+
+def _fold(bio):
+    text = bio if bio.isascii() else unicodedata.normalize("NFKC", bio)
+    lowered = text.lower()
+    for needle, pattern, replacement in _DEOBFUSCATIONS:
+        if needle is None or needle in lowered:
+            text = pattern.sub(replacement, text)
+    return text
+
+def normalize(bio):
+    """Fold unicode look-alikes, undo common obfuscations and lowercase."""
+    return _fold(bio).lower()
+
+def _is_bare_domain(raw_host, has_path, followed_by_word):
+    """Whether a host found without scheme is shaped like a domain rather than prose."""
+    if has_path:
+        return True
+    labels = raw_host.lower().split(".")
+    if labels[-1] in WORD_TLDS:
+        return len(labels) > 2
+    if labels[-2] in TLDS:
+        # co.uk style second-level domains are never prose
+        return True
+    # "I love life.Live it": a capital right after the dot, then more words,
+    # starts a sentence; "EarnFast.Xyz" at the end of a bio does not
+    tld = raw_host.rsplit(".", 1)[-1]
+    return not (followed_by_word and tld[0].isupper() and not raw_host.isupper())
+
+class DomainTrie:
+    """Trie over reversed domain labels; a stored domain also matches its subdomains."""
+
+    _END = object()
+
+    def __init__(self, domains=()):
+        self._root = {}
+        for domain in domains:
+            self.add(domain)
+
+    def add(self, domain):
+        node = self._root
+        for label in reversed(domain.lower().strip(".").split(".")):
+            node = node.setdefault(label, {})
+        node[self._END] = True
+
+    def matches(self, host):
+        node = self._root
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+            if self._END in node:
+                return True
+        return False
+
+    def __bool__(self):
+        return bool(self._root)
+
+class LinkDetector:
+    """Link matcher compiled from a chat's allow/deny lists and enabled categories.
+
+    Verdicts are memoized by a hash of the raw bio in a bounded LRU map.
+    """
+
+    def __init__(self, allowed=(), denied=(), categories=DEFAULT_CATEGORIES, memo_size=50000):
+        self.categories = frozenset(categories)
+        self.allowed = DomainTrie(d for d in allowed if not d.startswith("@"))
+        self.denied = DomainTrie(d for d in denied if not d.startswith("@"))
+        self.allowed_mentions = frozenset(d[1:].lower() for d in allowed if d.startswith("@"))
+        self.denied_mentions = frozenset(d[1:].lower() for d in denied if d.startswith("@"))
+        self.memo_size = memo_size
+        self._memo = LRUCache(memo_size)
+
+    def _scan_hosts(self, text):
+        for match in _HOST_RE.finditer(text):
+            raw_host = match.group()
+            host = raw_host.lower()
+            has_scheme = host.startswith("www.") or text.endswith("://", 0, match.start())
+            if host.startswith("www."):
+                host = host[4:]
+            if self.allowed and self.allowed.matches(host):
+                continue
+            if self.denied and self.denied.matches(host):
+                return True
+            if host.rsplit(".", 1)[-1] not in TLDS:
+                continue
+            if host in TELEGRAM_HOSTS or host.endswith(".t.me"):
+                if CATEGORY_TELEGRAM in self.categories:
+                    return True
+            elif has_scheme:
+                if CATEGORY_URL in self.categories:
+                    return True
+            elif CATEGORY_DOMAIN in self.categories and _is_bare_domain(
+                    raw_host, text.startswith("/", match.end()), _WORD_AFTER_RE.match(text, match.end()) is not None):
+                return True
+        return False
+
+    def _scan_mentions(self, text):
+        for match in _MENTION_RE.finditer(text):
+            handle = match.group(1).lower()
+            if handle in self.allowed_mentions:
+                continue
+            if handle in self.denied_mentions or CATEGORY_MENTION in self.categories:
+                return True
+        return False
+
+    def scan(self, bio):
+        """Return True if bio contains a link this detector should flag."""
+        text = _fold(bio)
+        if "." not in text and "@" not in text and "tg:" not in text.lower():
+            return False
+        if self._scan_hosts(text):
+            return True
+        if CATEGORY_TELEGRAM in self.categories and _TG_SCHEME_RE.search(text):
+            return True
+        if self.denied_mentions or CATEGORY_MENTION in self.categories:
+            return self._scan_mentions(text)
+        return False
+
+    def has_link(self, bio):
+        """Memoized scan()."""
+        if not bio:
+            return False
+        key = hashlib.blake2b(bio.encode("utf-8"), digest_size=16).digest()
+        verdict = self._memo.get(key)
+        if verdict is None:
+            verdict = self.scan(bio)
+            self._memo.set(key, verdict)
+        return verdict
+
+_detectors = LRUCache(maxsize=1024)
+
+def detector_for(settings):
+    """Return the compiled LinkDetector for a chat's settings, reusing identical configs."""
+    config = (
+        tuple(sorted(settings.get("allowed_domains", ()))),
+        tuple(sorted(settings.get("denied_domains", ()))),
+        tuple(sorted(settings.get("link_categories", DEFAULT_CATEGORIES)))
+    )
+    detector = _detectors.get(config)
+    if detector is None:
+        detector = LinkDetector(*config)
+        _detectors.set(config, detector)
+    return detector
+
+def has_link(bio, settings):
+    """Check bio for links using the chat's detection settings."""
+    return detector_for(settings).has_link(bio)
@@ -0,0 +1,20 @@
+from dotenv import load_dotenv
+import logging
+import os
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Messages use logging's lazy %-formatting with key=value fields, so records
+# below LOG_LEVEL cost a level check and nothing else.
+LOG_FORMAT = "ts=%(asctime)s level=%(levelname)s logger=%(name)s msg=%(message)s"
+
+def setup_logging(level=None):
+    """Configure the root logger from LOG_LEVEL (default INFO)."""
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+    # Pyrogram is chatty at INFO; keep it at WARNING unless we are debugging
+    if level != "DEBUG":
+        logging.getLogger("pyrogram").setLevel(logging.WARNING)
+
+setup_logging()
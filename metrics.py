@@ -0,0 +1,165 @@
+from bisect import bisect_left
+import asyncio
+import functools
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+_collectors = []
+_lag_monitor = None
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            # Per-bucket (non-cumulative) counts, then count and sum
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += 1
+        series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labelvalues, (counts, count, total) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labelvalues + (bound,))} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_count{labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {total}")
+        return lines
+
+def register_stats(prefix, stats_func):
+    """Expose a component's stats() dict as gauges named bio_<prefix>_<key>."""
+    _collectors.append((prefix, stats_func))
+
+def _render_collectors():
+    lines = []
+    for prefix, stats_func in _collectors:
+        for key, value in stats_func().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = f"bio_{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+    return lines
+
+def render():
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    lines.extend(_render_collectors())
+    return "\n".join(lines) + "\n"
+
+handler_latency = Histogram("bio_handler_latency_seconds", "Handler latency", ["handler"])
+api_calls = Counter("bio_telegram_api_calls_total", "Telegram API calls", ["method"])
+flood_waits = Counter("bio_flood_waits_total", "FloodWait errors received", ["method"])
+flood_wait_seconds = Counter("bio_flood_wait_seconds_total", "Seconds of FloodWait requested", ["method"])
+mongo_latency = Histogram("bio_mongo_operation_seconds", "MongoDB operation latency", ["operation"])
+loop_lag = Histogram("bio_event_loop_lag_seconds", "Event loop scheduling lag")
+
+def timed(handler):
+    """Record the wrapped coroutine's latency under handler_latency{handler=...}."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                handler_latency.observe(time.perf_counter() - start, handler)
+        return wrapper
+    return decorator
+
+def record_flood_wait(method, seconds):
+    flood_waits.inc(method)
+    flood_wait_seconds.inc(method, amount=seconds)
+
+async def monitor_loop_lag(interval=0.5):
+    """Measure how late the event loop wakes a sleeping task."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, time.perf_counter() - start - interval))
+
+async def _handle_scrape(reader, writer):
+    try:
+        request_line = await reader.readline()
+        # Drain the request headers
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[1] == b"/metrics":
+            body = render().encode()
+            status = b"200 OK"
+            content_type = b"text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = b"not found\n"
+            status = b"404 Not Found"
+            content_type = b"text/plain"
+        writer.write(
+            b"HTTP/1.1 " + status + b"\r\nContent-Type: " + content_type
+            + b"\r\nContent-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.warning("Metrics scrape failed error=%s", e)
+    finally:
+        writer.close()
+
+async def start_metrics_server(host=None, port=None):
+    """Serve /metrics on METRICS_HOST:METRICS_PORT and start the loop-lag monitor.
+
+    Set METRICS_PORT=0 to disable. Returns the asyncio server, or None.
+    """
+    global _lag_monitor
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    port = int(port if port is not None else os.getenv("METRICS_PORT", "9464"))
+    if _lag_monitor is None:
+        _lag_monitor = asyncio.ensure_future(monitor_loop_lag())
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle_scrape, host, port)
+    logger.info("Metrics endpoint listening host=%s port=%s", host, port)
+    return server
@@ -1,84 +1,107 @@
-import re
 from pyrogram import Client
 from pyrogram import enums
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ChatPermissions
 from pyrogram import errors
+from warning_store import WarningStore
+from link_detector import has_link
+from scheduler import action_scheduler
+import functools
+import os
 
-url_pattern = re.compile(
-    r'(https?://|www\.)[a-zA-Z0-9.\-]+(\.[a-zA-Z]{2,})+(/[a-zA-Z0-9._%+-]*)*'
+warning_store = WarningStore(
+    maxsize=int(os.getenv("WARNING_CACHE_SIZE", "100000")),
+    ttl=int(os.getenv("WARNING_TTL", str(7 * 24 * 3600))),
+    flush_interval=float(os.getenv("WARNING_FLUSH_INTERVAL", "5")),
+    flush_batch=int(os.getenv("WARNING_FLUSH_BATCH", "500"))
 )
 
-warnings = {}
+async def apply_punishment(client: Client, message, user_id: int, user_name: str, bio: str, settings: dict, chat_id: int = None):
+    """Apply punishment based on bio content and group settings.
 
-async def apply_punishment(client: Client, message, user_id: int, user_name: str, bio: str, settings: dict):
-    """Apply punishment based on bio content and group settings."""
-    if bio and re.search(url_pattern, bio):
-        try:
-            await message.delete()
-        except errors.MessageDeleteForbidden:
-            await message.reply_text("ᴘʟᴇᴀꜱᴇ ɢʀᴀɴᴛ ᴍᴇ ᴅᴇʟᴇᴛᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ 🗑")
-            return
+    message may be None when a user is punished without a triggering message
+    (e.g. by /scanall); notices are then sent to chat_id instead of as replies.
+    """
+    if message is not None:
+        chat_id = message.chat.id
+        reply_text = message.reply_text
+    else:
+        reply_text = functools.partial(client.send_message, chat_id)
+    if has_link(bio, settings):
+        if message is not None:
+            try:
+                await action_scheduler.delete(client, chat_id, message.id)
+            except errors.MessageDeleteForbidden:
+                await action_scheduler.call(chat_id, "send_message", reply_text, "ᴘʟᴇᴀꜱᴇ ɢʀᴀɴᴛ ᴍᴇ ᴅᴇʟᴇᴛᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ 🗑")
+                return
 
         if settings["type"] == "warn":
-            if user_id not in warnings:
-                warnings[user_id] = 0
-            warnings[user_id] += 1
-            sent_msg = await message.reply_text(
-                f"{user_name} ᴘʟᴇᴀꜱᴇ ʀᴇᴍᴏᴠᴇ ᴀɴʏ ʟɪɴᴋꜱ 🔗 ꜰʀᴏᴍ ʏᴏᴜʀ ʙɪᴏ. ⚠️ᴡᴀʀɴᴇᴅ {warnings[user_id]}/{settings['warning_limit']}",
+            warning_count = await warning_store.increment(chat_id, user_id)
+            sent_msg = await action_scheduler.call(
+                chat_id, "send_message", reply_text,
+                f"{user_name} ᴘʟᴇᴀꜱᴇ ʀᴇᴍᴏᴠᴇ ᴀɴʏ ʟɪɴᴋꜱ 🔗 ꜰʀᴏᴍ ʏᴏᴜʀ ʙɪᴏ. ⚠️ᴡᴀʀɴᴇᴅ {warning_count}/{settings['warning_limit']}",
                 parse_mode=enums.ParseMode.HTML
             )
-            if warnings[user_id] >= settings["warning_limit"]:
+            if warning_count >= settings["warning_limit"]:
                 try:
                     if settings["punishment"] == "mute":
-                        await client.restrict_chat_member(message.chat.id, user_id, ChatPermissions())
+                        if not await action_scheduler.punish("mute", chat_id, user_id, "restrict_chat_member", client.restrict_chat_member, chat_id, user_id, ChatPermissions()):
+                            return
                         keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("ᴜɴᴍᴜᴛᴇ 🫰🏻", callback_data=f"unmute_{user_id}")]])
-                        await sent_msg.edit(
+                        await action_scheduler.call(
+                            chat_id, "edit_message_text", sent_msg.edit,
                             f"{user_name} ʜᴀꜱ ʙᴇᴇɴ 🔇 ᴍᴜᴛᴇᴅ ꜰᴏʀ [ ʟɪɴᴋ ɪɴ ʙɪᴏ ].",
                             reply_markup=keyboard,
                             parse_mode=enums.ParseMode.HTML
                         )
                     elif settings["punishment"] == "ban":
-                        await client.ban_chat_member(message.chat.id, user_id)
+                        if not await action_scheduler.punish("ban", chat_id, user_id, "ban_chat_member", client.ban_chat_member, chat_id, user_id):
+                            return
                         keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("ᴜɴʙᴀɴ 🪼", callback_data=f"unban_{user_id}")]])
-                        await sent_msg.edit(
+                        await action_scheduler.call(
+                            chat_id, "edit_message_text", sent_msg.edit,
                             f"{user_name} ʜᴀꜱ ʙᴇᴇɴ 🔨 ʙᴀɴɴᴇᴅ ꜰᴏʀ [ ʟɪɴᴋ ɪɴ ʙɪᴏ ].",
                             reply_markup=keyboard,
                             parse_mode=enums.ParseMode.HTML
                         )
                     elif settings["punishment"] == "delete":
-                        await sent_msg.edit(
+                        await action_scheduler.call(
+                            chat_id, "edit_message_text", sent_msg.edit,
                             f"{user_name}'ꜱ ᴍᴇꜱꜱᴀɢᴇꜱ ᴀʀᴇ ʙᴇɪɴɢ ᴅᴇʟᴇᴛᴇᴅ ᴅᴜᴇ ᴛᴏ ᴀ ʟɪɴᴋ ɪɴ ᴛʜᴇɪʀ ʙɪᴏ.",
                             parse_mode=enums.ParseMode.HTML
                         )
                 except errors.ChatAdminRequired:
-                    await sent_msg.edit(f"ɪ ᴅᴏɴ'ᴛ ʜᴀᴠᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ ᴛᴏ {settings['punishment']} ᴜꜱᴇʀꜱ.")
+                    await action_scheduler.call(chat_id, "edit_message_text", sent_msg.edit, f"ɪ ᴅᴏɴ'ᴛ ʜᴀᴠᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ ᴛᴏ {settings['punishment']} ᴜꜱᴇʀꜱ.")
         elif settings["punishment"] == "mute":
             try:
-                await client.restrict_chat_member(message.chat.id, user_id, ChatPermissions())
+                if not await action_scheduler.punish("mute", chat_id, user_id, "restrict_chat_member", client.restrict_chat_member, chat_id, user_id, ChatPermissions()):
+                    return
                 keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Unmute", callback_data=f"unmute_{user_id}")]])
-                await message.reply_text(
+                await action_scheduler.call(
+                    chat_id, "send_message", reply_text,
                     f"{user_name} ʜᴀꜱ ʙᴇᴇɴ 🔇 ᴍᴜᴛᴇᴅ ꜰᴏʀ [ ʟɪɴᴋ ɪɴ ʙɪᴏ ].",
                     reply_markup=keyboard,
                     parse_mode=enums.ParseMode.HTML
                 )
             except errors.ChatAdminRequired:
-                await message.reply_text("ɪ ᴅᴏɴ'ᴛ ʜᴀᴠᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ ᴛᴏ ᴍᴜᴛᴇ ᴜꜱᴇʀꜱ.")
+                await action_scheduler.call(chat_id, "send_message", reply_text, "ɪ ᴅᴏɴ'ᴛ ʜᴀᴠᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ ᴛᴏ ᴍᴜᴛᴇ ᴜꜱᴇʀꜱ.")
         elif settings["punishment"] == "ban":
             try:
-                await client.ban_chat_member(message.chat.id, user_id)
+                if not await action_scheduler.punish("ban", chat_id, user_id, "ban_chat_member", client.ban_chat_member, chat_id, user_id):
+                    return
                 keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Unban", callback_data=f"unban_{user_id}")]])
-                await message.reply_text(
+                await action_scheduler.call(
+                    chat_id, "send_message", reply_text,
                     f"{user_name} ʜᴀꜱ ʙᴇᴇɴ 🔨 ʙᴀɴɴᴇᴅ ꜰᴏʀ [ ʟɪɴᴋ ɪɴ ʙɪᴏ ].",
                     reply_markup=keyboard,
                     parse_mode=enums.ParseMode.HTML
                 )
             except errors.ChatAdminRequired:
-                await message.reply_text("ɪ ᴅᴏɴ'ᴛ ʜᴀᴠᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ ᴛᴏ ʙᴀɴ ᴜꜱᴇʀꜱ.")
+                await action_scheduler.call(chat_id, "send_message", reply_text, "ɪ ᴅᴏɴ'ᴛ ʜᴀᴠᴇ ᴘᴇʀᴍɪꜱꜱɪᴏɴ ᴛᴏ ʙᴀɴ ᴜꜱᴇʀꜱ.")
         elif settings["punishment"] == "delete":
-            await message.reply_text(
+            await action_scheduler.call(
+                chat_id, "send_message", reply_text,
                 f"{user_name}'ꜱ ᴍᴇꜱꜱᴀɢᴇꜱ ᴀʀᴇ ʙᴇɪɴɢ ᴅᴇʟᴇᴛᴇᴅ ᴅᴜᴇ ᴛᴏ ᴀ ʟɪɴᴋ ɪɴ ᴛʜᴇɪʀ ʙɪᴏ.",
                 parse_mode=enums.ParseMode.HTML
             )
     else:
-        if user_id in warnings:
-            del warnings[user_id]
+        warning_store.reset(chat_id, user_id)
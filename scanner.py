@@ -0,0 +1,191 @@
+from datetime import datetime
+from bson import Int64
+from pyrogram import enums, errors
+from database import db, run_db, get_group_settings
+from link_detector import has_link
+from punishments import apply_punishment
+from scheduler import TokenBucket
+from metrics import api_calls, record_flood_wait
+import asyncio
+import logging
+import pymongo.errors
+
+logger = logging.getLogger(__name__)
+
+scans_collection = db["scans"]
+
+SKIP_STATUSES = (enums.ChatMemberStatus.OWNER, enums.ChatMemberStatus.ADMINISTRATOR)
+
+class ScanSummary:
+    __slots__ = ("scanned", "flagged", "skipped", "failed", "resumed_from", "completed")
+
+    def __init__(self, resumed_from=0):
+        self.scanned = 0
+        self.flagged = 0
+        self.skipped = 0
+        self.failed = 0
+        self.resumed_from = resumed_from
+        self.completed = False
+
+class MemberScanner:
+    """Retroactive bio scan over a group's existing members.
+
+    Members are streamed from get_chat_members in chunks of checkpoint_every,
+    so memory stays bounded regardless of group size. Profiles are fetched with
+    at most concurrency requests in flight, paced to rate per second, and
+    FloodWait pauses the shared bucket, so every task waits it out before the
+    call is retried. After each chunk the
+    number of members processed is saved in the scans collection, so an
+    interrupted scan resumes where it left off.
+
+    Telegram may return fewer members than the group has when listing very
+    large groups; the scan covers every member the API returns.
+    """
+
+    def __init__(self, verdicts, concurrency=8, rate=20, checkpoint_every=200, max_retries=5):
+        self.verdicts = verdicts
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(rate, concurrency)
+        self._running = set()
+
+    def is_running(self, chat_id):
+        return chat_id in self._running
+
+    def claim(self, chat_id):
+        """Mark chat_id as being scanned; return False if a scan is already running.
+
+        Call before the first await of a handler that starts run(), so two
+        commands arriving together can't both start a scan.
+        """
+        if chat_id in self._running:
+            return False
+        self._running.add(chat_id)
+        return True
+
+    async def _load_offset(self, chat_id):
+        scan = await run_db(scans_collection.find_one, {"chat_id": Int64(chat_id)})
+        if scan and scan.get("status") == "running":
+            return scan.get("offset", 0), scan.get("scanned", 0), scan.get("flagged", 0), scan.get("failed", 0)
+        return 0, 0, 0, 0
+
+    async def _save_progress(self, chat_id, status, offset, summary):
+        try:
+            await run_db(
+                scans_collection.update_one,
+                {"chat_id": Int64(chat_id)},
+                {"$set": {
+                    "chat_id": Int64(chat_id),
+                    "status": status,
+                    "offset": offset,
+                    "scanned": summary.scanned,
+                    "flagged": summary.flagged,
+                    "failed": summary.failed,
+                    "updated_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+        except pymongo.errors.PyMongoError as e:
+            logger.error("Failed to save scan progress chat_id=%s error=%s", chat_id, e)
+
+    async def _with_flood_wait(self, method, func, *args):
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            try:
+                return await func(*args)
+            except errors.FloodWait as e:
+                # Recorded in the flood wait metrics by the profile cache
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("FloodWait during scan method=%s seconds=%s", method, e.value)
+                self._bucket.pause(e.value)
+
+    async def _scan_member(self, client, chat_id, member, settings, summary, semaphore):
+        async with semaphore:
+            if member.user.is_bot or member.status in SKIP_STATUSES:
+                summary.skipped += 1
+                return
+            try:
+                verdict = await self._with_flood_wait("get_chat", self.verdicts.scan, client, member.user.id, chat_id)
+            except errors.RPCError as e:
+                # Telegram answered, e.g. for a deleted account; retrying won't help
+                logger.warning("Failed to scan member chat_id=%s user_id=%s error=%s", chat_id, member.user.id, e)
+                summary.skipped += 1
+                return
+            summary.scanned += 1
+            profile = verdict.profile
+            if has_link(profile.bio, settings):
+                summary.flagged += 1
+                try:
+                    await apply_punishment(client, None, profile.user_id, profile.display_name, profile.bio, settings, chat_id=chat_id)
+                except Exception as e:
+                    # e.g. the member left mid-scan; one failure must not stop the scan
+                    logger.warning("Failed to punish member chat_id=%s user_id=%s error=%s", chat_id, profile.user_id, e)
+                    summary.failed += 1
+
+    async def _scan_chunk(self, client, chat_id, chunk, offset, settings, summary, semaphore):
+        """Scan chunk, which starts at offset, and return the offset after it.
+
+        A member whose profile couldn't be fetched for a client-side reason
+        (e.g. the client was stopped) is not skipped: progress is saved just
+        before the first such member and its error is raised, so a resume
+        scans it again.
+        """
+        results = await asyncio.gather(
+            *(self._scan_member(client, chat_id, m, settings, summary, semaphore) for m in chunk),
+            return_exceptions=True
+        )
+        for position, result in enumerate(results):
+            if isinstance(result, BaseException):
+                await self._save_progress(chat_id, "running", offset + position, summary)
+                raise result
+        return offset + len(chunk)
+
+    async def _members(self, client, chat_id, skip):
+        """Yield members after the first skip, restarting the listing after FloodWait."""
+        retries = 0
+        while True:
+            position = 0
+            try:
+                api_calls.inc("get_chat_members")
+                async for member in client.get_chat_members(chat_id):
+                    position += 1
+                    if position <= skip:
+                        continue
+                    skip = position
+                    yield member
+                return
+            except errors.FloodWait as e:
+                record_flood_wait("get_chat_members", e.value)
+                retries += 1
+                if retries > self.max_retries:
+                    raise
+                logger.warning("FloodWait while listing members chat_id=%s seconds=%s", chat_id, e.value)
+                self._bucket.pause(e.value)
+                await asyncio.sleep(e.value)
+
+    async def run(self, client, chat_id):
+        """Scan chat_id's members, resuming an interrupted scan; returns a ScanSummary."""
+        self._running.add(chat_id)
+        try:
+            offset, scanned, flagged, failed = await self._load_offset(chat_id)
+            summary = ScanSummary(resumed_from=offset)
+            summary.scanned, summary.flagged, summary.failed = scanned, flagged, failed
+            settings = await get_group_settings(chat_id)
+            semaphore = asyncio.Semaphore(self.concurrency)
+            await self._save_progress(chat_id, "running", offset, summary)
+
+            chunk = []
+            async for member in self._members(client, chat_id, offset):
+                chunk.append(member)
+                if len(chunk) >= self.checkpoint_every:
+                    offset = await self._scan_chunk(client, chat_id, chunk, offset, settings, summary, semaphore)
+                    chunk = []
+                    await self._save_progress(chat_id, "running", offset, summary)
+            offset = await self._scan_chunk(client, chat_id, chunk, offset, settings, summary, semaphore)
+            summary.completed = True
+            await self._save_progress(chat_id, "completed", offset, summary)
+            return summary
+        finally:
+            self._running.discard(chat_id)
@@ -0,0 +1,366 @@
+from pyrogram import errors
+from cache import LRUCache, TTLCache
+from metrics import api_calls, record_flood_wait
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers run first
+PRIORITY_ADMIN = 0       # replies to admins: /config, callback edits
+PRIORITY_MODERATION = 1  # mute/ban and punishment notices
+PRIORITY_BULK = 2        # batched deletes
+
+# Telegram deletes at most 100 messages per delete_messages call
+MAX_DELETE_BATCH = 100
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next seconds, e.g. after FloodWait."""
+        self._refill()
+        self.tokens = 0
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        # No refill while paused, so the bucket doesn't burst when it resumes
+        self.updated_at = max(self.updated_at, self.paused_until)
+
+    def _refill(self):
+        now = time.monotonic()
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def delay(self):
+        """Seconds until a token is available, 0 if one is available now."""
+        self._refill()
+        paused = self.paused_until - time.monotonic()
+        if paused > 0:
+            return paused
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def try_acquire(self):
+        """Take a token if one is available now."""
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep(self.delay())
+
+class _Action:
+    __slots__ = ("chat_id", "method", "func", "args", "kwargs", "priority", "seq", "attempts", "future")
+
+    def __init__(self, chat_id, method, func, args, kwargs, priority, seq):
+        self.chat_id = chat_id
+        self.method = method
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.attempts = 0
+        self.future = asyncio.get_running_loop().create_future()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class _ChatQueue:
+    """A chat's pending actions and its rate limit.
+
+    ready_key is the (priority, seq) under which the chat sits in the ready
+    heap, and timer is set while it waits for a token; a chat is in at most
+    one of the two.
+    """
+    __slots__ = ("bucket", "actions", "ready_key", "timer")
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.actions = []
+        self.ready_key = None
+        self.timer = None
+
+class ActionScheduler:
+    """Rate-limited outbound queue for Telegram API calls.
+
+    Calls are queued per chat by priority. A chat is handed to the fixed set of
+    workers only once its bucket has a token, so a chat at its rate limit
+    waits on a timer instead of holding a worker, and other chats' calls go
+    ahead. Workers then take a token from the global bucket, and run the
+    highest priority call across all ready chats first. FloodWait pauses all
+    workers for the requested time and the call is requeued. Deletes from
+    the same chat are coalesced into delete_messages batches, and a mute or
+    ban for a user who is already being punished is dropped.
+    """
+
+    def __init__(self, workers=4, global_rate=25, global_burst=30, chat_rate=1, chat_burst=5,
+                 delete_window=0.2, max_retries=3, punish_window=60, max_chats=10000):
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.delete_window = delete_window
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.calls = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+        self.deletes_coalesced = 0
+        self.duplicates_dropped = 0
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._chat_buckets = LRUCache(max_chats)
+        self._chats = {}
+        self._ready = []
+        self._ready_event = None
+        self._drained = None
+        self._queued = 0
+        self._unfinished = 0
+        self._seq = itertools.count()
+        self._workers = []
+        self._closed = False
+        self._paused_until = 0
+        self._pending_deletes = {}
+        self._punishing = {}
+        self._recent_punishments = TTLCache(maxsize=100000, ttl=punish_window)
+
+    def _ensure_workers(self):
+        if self._ready_event is None:
+            self._ready_event = asyncio.Event()
+            self._drained = asyncio.Event()
+        if not self._workers:
+            self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    def _submit(self, chat_id, method, func, args, kwargs, priority):
+        if self._closed:
+            raise RuntimeError("ActionScheduler is closed")
+        self._ensure_workers()
+        action = _Action(chat_id, method, func, args, kwargs, priority, next(self._seq))
+        self._unfinished += 1
+        self._drained.clear()
+        self._enqueue(action)
+        return action.future
+
+    def _enqueue(self, action):
+        chat = self._chats.get(action.chat_id)
+        if chat is None:
+            chat = self._chats[action.chat_id] = _ChatQueue(self._chat_bucket(action.chat_id))
+        heapq.heappush(chat.actions, action)
+        self._queued += 1
+        self._schedule(action.chat_id, chat)
+
+    def _schedule(self, chat_id, chat):
+        """Put chat in the ready heap if it has a token, else wake it when it will."""
+        if chat.timer is not None:
+            return
+        head = chat.actions[0]
+        delay = chat.bucket.delay()
+        if delay > 0:
+            chat.ready_key = None
+            chat.timer = asyncio.get_running_loop().call_later(delay, self._wake_chat, chat_id)
+        elif chat.ready_key != (head.priority, head.seq):
+            # Any older entry for this chat in the heap is now stale
+            chat.ready_key = (head.priority, head.seq)
+            heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+            self._ready_event.set()
+
+    def _wake_chat(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            chat.timer = None
+            self._schedule(chat_id, chat)
+
+    def _next_action(self):
+        """Pop the highest priority action among chats with a token, or None."""
+        while self._ready:
+            priority, seq, chat_id = heapq.heappop(self._ready)
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.ready_key != (priority, seq):
+                continue
+            chat.ready_key = None
+            while chat.actions and chat.actions[0].future.cancelled():
+                # Callers that gave up don't spend the chat's tokens
+                heapq.heappop(chat.actions)
+                self._queued -= 1
+                self._finished()
+            if not chat.actions:
+                del self._chats[chat_id]
+                continue
+            if not chat.bucket.try_acquire():
+                self._schedule(chat_id, chat)
+                continue
+            action = heapq.heappop(chat.actions)
+            self._queued -= 1
+            if chat.actions:
+                self._schedule(chat_id, chat)
+            else:
+                del self._chats[chat_id]
+            return action
+        return None
+
+    async def call(self, chat_id, method, func, *args, priority=PRIORITY_MODERATION, **kwargs):
+        """Queue func(*args, **kwargs) against chat_id's rate limit and await its result.
+
+        method is the Telegram API method func calls (e.g. "send_message" for
+        message.reply_text), used to label metrics and logs.
+        """
+        return await self._submit(chat_id, method, func, args, kwargs, priority)
+
+    async def _run(self, action):
+        """Run action; return False if it was requeued after FloodWait."""
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._global_bucket.acquire()
+        method = action.method
+        try:
+            self.calls += 1
+            api_calls.inc(method)
+            result = await action.func(*action.args, **action.kwargs)
+        except errors.FloodWait as e:
+            self.flood_waits += 1
+            self.flood_wait_seconds += e.value
+            record_flood_wait(method, e.value)
+            logger.warning("FloodWait method=%s seconds=%s attempt=%s", method, e.value, action.attempts)
+            self._paused_until = max(self._paused_until, time.monotonic() + e.value)
+            if action.attempts == self.max_retries:
+                raise
+            action.attempts += 1
+            self._enqueue(action)
+            return False
+        if not action.future.cancelled():
+            action.future.set_result(result)
+        return True
+
+    def _finished(self):
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._drained.set()
+
+    async def _worker(self):
+        while True:
+            action = self._next_action()
+            if action is None:
+                self._ready_event.clear()
+                await self._ready_event.wait()
+                continue
+            done = True
+            try:
+                if not action.future.cancelled():
+                    done = await self._run(action)
+            except asyncio.CancelledError:
+                action.future.cancel()
+                raise
+            except Exception as e:
+                if not action.future.cancelled():
+                    action.future.set_exception(e)
+            finally:
+                if done:
+                    self._finished()
+
+    async def delete(self, client, chat_id, message_id):
+        """Delete a message, batched with other deletes from the same chat."""
+        if self._closed:
+            raise RuntimeError("ActionScheduler is closed")
+        pending = self._pending_deletes.get(chat_id)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = self._pending_deletes[chat_id] = (client, [], loop.create_future())
+            loop.call_later(self.delete_window, self._flush_deletes, chat_id)
+        else:
+            self.deletes_coalesced += 1
+        _, message_ids, future = pending
+        message_ids.append(message_id)
+        if len(message_ids) >= MAX_DELETE_BATCH:
+            self._flush_deletes(chat_id)
+        return await asyncio.shield(future)
+
+    def _flush_deletes(self, chat_id):
+        pending = self._pending_deletes.pop(chat_id, None)
+        if pending is None:
+            return
+        client, message_ids, future = pending
+        result = self._submit(chat_id, "delete_messages", client.delete_messages, (chat_id, message_ids), {}, PRIORITY_BULK)
+
+        def _done(result):
+            if future.done():
+                return
+            if result.cancelled():
+                future.cancel()
+            elif result.exception() is not None:
+                future.set_exception(result.exception())
+            else:
+                future.set_result(result.result())
+        result.add_done_callback(_done)
+
+    async def punish(self, kind, chat_id, user_id, method, func, *args, **kwargs):
+        """Run a mute/ban once per user; return False if it was dropped as a duplicate."""
+        key = (kind, chat_id, user_id)
+        if key in self._punishing or self._recent_punishments.get(key) is not None:
+            self.duplicates_dropped += 1
+            return False
+        self._punishing[key] = True
+        try:
+            await self.call(chat_id, method, func, *args, priority=PRIORITY_MODERATION, **kwargs)
+            self._recent_punishments.set(key, True)
+        finally:
+            self._punishing.pop(key, None)
+        return True
+
+    def forget_punishment(self, kind, chat_id, user_id):
+        """Allow a user to be punished again, e.g. after an admin lifts the mute/ban."""
+        self._recent_punishments.invalidate((kind, chat_id, user_id))
+
+    async def close(self):
+        """Flush pending deletes, drain the queue and stop the workers.
+
+        Calls submitted afterwards raise RuntimeError instead of restarting
+        the workers.
+        """
+        for chat_id in list(self._pending_deletes):
+            self._flush_deletes(chat_id)
+        if self._unfinished:
+            await self._drained.wait()
+        self._closed = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self):
+        return {
+            "queued": self._queued,
+            "chats": len(self._chats),
+            "calls": self.calls,
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "deletes_coalesced": self.deletes_coalesced,
+            "duplicates_dropped": self.duplicates_dropped
+        }
+
+action_scheduler = ActionScheduler(
+    workers=int(os.getenv("ACTION_WORKERS", "4")),
+    global_rate=float(os.getenv("ACTION_GLOBAL_RATE", "25")),
+    global_burst=int(os.getenv("ACTION_GLOBAL_BURST", "30")),
+    chat_rate=float(os.getenv("ACTION_CHAT_RATE", "1")),
+    chat_burst=int(os.getenv("ACTION_CHAT_BURST", "5")),
+    delete_window=float(os.getenv("ACTION_DELETE_WINDOW", "0.2"))
+)
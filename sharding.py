@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pyrogram import filters
+from database import db, run_db
+from dotenv import load_dotenv
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import pymongo.errors
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+shard_count = int(os.getenv("SHARD_COUNT", "1"))
+shard_id = int(os.getenv("SHARD_ID", "0"))
+if not 0 <= shard_id < shard_count:
+    raise ValueError(f"SHARD_ID must be between 0 and {shard_count - 1}")
+
+shards_collection = db["shards"]
+
+def shard_for(chat_id, count=None):
+    """Stable shard index for chat_id, identical across processes and restarts."""
+    count = count or shard_count
+    digest = hashlib.blake2b(str(chat_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+def owns_chat(chat_id):
+    return shard_count == 1 or shard_for(chat_id) == shard_id
+
+def _update_chat_id(update):
+    chat = getattr(update, "chat", None)
+    if chat is None and getattr(update, "message", None) is not None:
+        # CallbackQuery
+        chat = update.message.chat
+    return chat.id if chat is not None else None
+
+async def _owns_update(_, __, update):
+    chat_id = _update_chat_id(update)
+    return chat_id is None or owns_chat(chat_id)
+
+# Add to every handler so each worker only processes the chats it owns; updates
+# for chats that hash to another shard are left to that shard's worker
+shard_filter = filters.create(_owns_update, "ShardFilter")
+
+class LeaseLost(Exception):
+    pass
+
+class ShardLease:
+    """Exclusive, heartbeated ownership of one shard, recorded in MongoDB.
+
+    A worker must hold its shard's lease before handling updates. The lease
+    expires ttl seconds after the last heartbeat, so a crashed worker's shard
+    can be taken over by its replacement.
+    """
+
+    def __init__(self, shard_id, ttl=30, owner=None):
+        self.shard_id = shard_id
+        self.ttl = ttl
+        # launcher.py sets SHARD_OWNER so a restarted worker reclaims its lease
+        # immediately instead of waiting for the crashed one's to expire
+        self.owner = owner or os.getenv("SHARD_OWNER") or f"{socket.gethostname()}:{os.getpid()}"
+        self.held = False
+
+    async def try_acquire(self):
+        now = datetime.utcnow()
+        try:
+            await run_db(
+                shards_collection.find_one_and_update,
+                {"_id": self.shard_id, "$or": [{"expires_at": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl), "heartbeat_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except pymongo.errors.DuplicateKeyError:
+            # Another live worker holds the lease
+            return False
+        self.held = True
+        return True
+
+    async def acquire(self, poll_interval=None):
+        """Wait until the lease is ours."""
+        poll_interval = poll_interval or self.ttl / 3
+        while not await self.try_acquire():
+            logger.info("Waiting for shard lease shard_id=%s", self.shard_id)
+            await asyncio.sleep(poll_interval)
+        logger.info("Acquired shard lease shard_id=%s owner=%s", self.shard_id, self.owner)
+
+    async def renew(self):
+        now = datetime.utcnow()
+        doc = await run_db(
+            shards_collection.find_one_and_update,
+            {"_id": self.shard_id, "owner": self.owner},
+            {"$set": {"expires_at": now + timedelta(seconds=self.ttl), "heartbeat_at": now}}
+        )
+        if doc is None:
+            self.held = False
+            raise LeaseLost(f"Lease for shard {self.shard_id} was taken over")
+
+    async def heartbeat(self):
+        """Renew the lease every ttl/3 seconds; raises LeaseLost if it is taken."""
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self.renew()
+            except pymongo.errors.PyMongoError as e:
+                logger.warning("Shard lease renewal failed shard_id=%s error=%s", self.shard_id, e)
+
+    async def release(self):
+        if not self.held:
+            return
+        try:
+            await run_db(shards_collection.delete_one, {"_id": self.shard_id, "owner": self.owner})
+        except pymongo.errors.PyMongoError as e:
+            logger.warning("Failed to release shard lease shard_id=%s error=%s", self.shard_id, e)
+        self.held = False
@@ -0,0 +1,32 @@
+import asyncio
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight awaitable.
+
+    The first caller for a key starts the call; callers arriving while it runs
+    wait on the same task and get its result or its exception. A waiter being
+    cancelled does not cancel the shared call.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.saved = 0
+        self._inflight = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        """Await func(*args, **kwargs), sharing the call with concurrent callers for key."""
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.saved += 1
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def stats(self):
+        return {"calls": self.calls, "saved": self.saved, "inflight": len(self._inflight)}
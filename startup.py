@@ -0,0 +1,36 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class StartupTimer:
+    """Record how long each startup stage takes and log a summary."""
+
+    def __init__(self):
+        self.stages = {}
+        self.total = None
+        self._started_at = time.perf_counter()
+
+    async def run(self, stage, awaitable):
+        """Await awaitable, recording its duration under stage."""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[stage] = time.perf_counter() - start
+
+    async def run_concurrently(self, **stages):
+        """Run independent stages at the same time, each timed separately."""
+        return await asyncio.gather(*(self.run(stage, awaitable) for stage, awaitable in stages.items()))
+
+    def finish(self):
+        self.total = time.perf_counter() - self._started_at
+        logger.info("Startup complete total=%.3fs %s", self.total,
+                    " ".join(f"{stage}={seconds:.3f}s" for stage, seconds in self.stages.items()))
+
+    def stats(self):
+        stats = {f"{stage}_seconds": seconds for stage, seconds in self.stages.items()}
+        if self.total is not None:
+            stats["total_seconds"] = self.total
+        return stats
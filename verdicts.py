@@ -0,0 +1,103 @@
+from cache import LRUCache
+from link_detector import detector_for
+import hashlib
+import time
+
+class BioVerdict:
+    """Whether a user's bio was clean or flagged when last scanned."""
+    __slots__ = ("profile", "fingerprint", "flagged", "checked_at")
+
+    def __init__(self, profile, fingerprint, flagged, checked_at):
+        self.profile = profile
+        self.fingerprint = fingerprint
+        self.flagged = flagged
+        self.checked_at = checked_at
+
+def fingerprint(bio):
+    return hashlib.blake2b(bio.encode("utf-8"), digest_size=16).digest()
+
+class BioVerdictCache:
+    """Per-user bio verdicts so a bio is fetched and scanned once per change.
+
+    A clean verdict is trusted for clean_recheck seconds and a flagged one for
+    flagged_recheck seconds (so users who remove their link are noticed
+    quickly). A user's first message in a chat, a name change seen on a
+    message, or an explicit scan() forces a refetch unless the verdict is
+    younger than fresh_window seconds.
+
+    Rescans always refetch the profile, whatever its age in the profile
+    cache, so the recheck intervals above (not PROFILE_CACHE_TTL) bound how
+    stale a bio can be; concurrent rescans of a user still share one get_chat.
+
+    The flag uses the default link detector; chats with their own allow/deny
+    lists re-run has_link() on verdict.profile.bio, which is memoized.
+    """
+
+    def __init__(self, profiles, clean_recheck=3600, flagged_recheck=60, fresh_window=60,
+                 maxsize=200000, seen_size=500000):
+        self.profiles = profiles
+        self.clean_recheck = clean_recheck
+        self.flagged_recheck = flagged_recheck
+        self.fresh_window = fresh_window
+        self.maxsize = maxsize
+        self.seen_size = seen_size
+        self.served = 0
+        self.rechecks = 0
+        self.bio_changes = 0
+        self._verdicts = LRUCache(maxsize)
+        self._seen = LRUCache(seen_size)
+
+    def _first_post(self, chat_id, user_id):
+        key = (chat_id, user_id)
+        if self._seen.get(key):
+            return False
+        self._seen.set(key, True)
+        return True
+
+    def _is_due(self, verdict, user, force):
+        age = time.monotonic() - verdict.checked_at
+        if age > (self.flagged_recheck if verdict.flagged else self.clean_recheck):
+            return True
+        if age > self.fresh_window and (force or (user is not None and not verdict.profile.matches(user))):
+            return True
+        return False
+
+    async def _rescan(self, client, user_id, user):
+        self.rechecks += 1
+        profile = await self.profiles.fetch(client, user_id, user, refresh=True)
+        new_fingerprint = fingerprint(profile.bio)
+        previous = self._verdicts.peek(user_id)
+        if previous is not None and previous.fingerprint != new_fingerprint:
+            self.bio_changes += 1
+        verdict = BioVerdict(profile, new_fingerprint, detector_for({}).has_link(profile.bio), time.monotonic())
+        self._verdicts.set(user_id, verdict)
+        return verdict
+
+    async def check(self, client, user_id, user=None, chat_id=None):
+        """Return the verdict for user_id, rescanning only when it is due."""
+        force = chat_id is not None and self._first_post(chat_id, user_id)
+        verdict = self._verdicts.get(user_id)
+        if verdict is None or self._is_due(verdict, user, force):
+            return await self._rescan(client, user_id, user)
+        self.served += 1
+        return verdict
+
+    async def scan(self, client, user_id, chat_id=None):
+        """Eagerly (re)scan a user, e.g. when they join a chat."""
+        if chat_id is not None:
+            self._first_post(chat_id, user_id)
+        verdict = self._verdicts.get(user_id)
+        if verdict is not None and time.monotonic() - verdict.checked_at <= self.fresh_window:
+            return verdict
+        return await self._rescan(client, user_id, None)
+
+    def invalidate(self, user_id):
+        self._verdicts.invalidate(user_id)
+
+    def stats(self):
+        return {
+            "verdicts": len(self._verdicts),
+            "served": self.served,
+            "rechecks": self.rechecks,
+            "bio_changes": self.bio_changes
+        }
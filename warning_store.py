@@ -0,0 +1,168 @@
+from datetime import datetime
+from bson import Int64
+from pymongo import UpdateOne, DeleteOne
+from database import db, run_db
+from cache import LRUCache, TTLCache
+from write_behind import BatchFlusher
+from singleflight import SingleFlight
+import asyncio
+import logging
+import time
+import pymongo.errors
+
+logger = logging.getLogger(__name__)
+
+warnings_collection = db["warnings"]
+
+# MongoDB error code for creating an index that exists with other options
+INDEX_OPTIONS_CONFLICT = 85
+
+class WarningStore(BatchFlusher):
+    """Chat-scoped warning counters keyed by (chat_id, user_id).
+
+    Hot counters live in a bounded LRU map. Changes are written behind to
+    MongoDB in unordered bulk batches, either every flush_interval seconds or
+    as soon as flush_batch keys are dirty. A TTL index on updated_at lets
+    warnings decay after ttl seconds without activity.
+
+    Increments and resets never await between reading and writing a counter,
+    so they are atomic with respect to other handlers on the event loop.
+    """
+
+    def __init__(self, maxsize=100000, ttl=7 * 24 * 3600, flush_interval=5, flush_batch=500):
+        super().__init__(flush_interval, flush_batch)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._counts = LRUCache(maxsize)
+        self._dirty = {}
+        # Keys not in memory whose stored counter this process already deleted
+        self._cleared = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._loads = SingleFlight()
+        self._indexes_ready = False
+
+    def _current(self, key):
+        entry = self._counts.peek(key)
+        if entry is None:
+            return None
+        count, updated_at = entry
+        if time.time() - updated_at > self.ttl:
+            return 0
+        return count
+
+    def _put(self, key, count, updated_at):
+        # Dirty values are kept in self._dirty until flushed, so eviction is safe
+        self._counts.set(key, (count, updated_at))
+
+    def _mark_dirty(self, key, count, updated_at):
+        self._dirty[key] = (count, updated_at)
+        self._pending_changed(len(self._dirty))
+
+    async def _load_from_db(self, key):
+        chat_id, user_id = key
+        doc = await run_db(warnings_collection.find_one, {"chat_id": Int64(chat_id), "user_id": Int64(user_id)})
+        if not doc:
+            return 0, time.time()
+        updated_at = doc["updated_at"].timestamp() if doc.get("updated_at") else time.time()
+        return doc.get("count", 0), updated_at
+
+    async def _load(self, key):
+        if key in self._counts:
+            return
+        if key in self._dirty:
+            self._put(key, *self._dirty[key])
+            return
+        try:
+            count, updated_at = await self._loads.do(key, self._load_from_db, key)
+        except pymongo.errors.PyMongoError as e:
+            logger.error("Failed to load warnings chat_id=%s user_id=%s error=%s", key[0], key[1], e)
+            count, updated_at = 0, time.time()
+        # Another waiter may have already populated or changed the counter
+        if key not in self._counts:
+            self._put(key, count, updated_at)
+
+    async def get(self, chat_id, user_id):
+        key = (chat_id, user_id)
+        await self._load(key)
+        return self._current(key)
+
+    async def increment(self, chat_id, user_id):
+        """Add one warning for user_id in chat_id and return the new count."""
+        key = (chat_id, user_id)
+        await self._load(key)
+        count = (self._current(key) or 0) + 1
+        now = time.time()
+        self._cleared.invalidate(key)
+        self._put(key, count, now)
+        self._mark_dirty(key, count, now)
+        return count
+
+    def reset(self, chat_id, user_id):
+        """Clear the warnings for user_id in chat_id.
+
+        A counter that isn't in memory may still be stored in MongoDB, so the
+        first reset of such a key deletes it without caching a zero; the key
+        is then remembered in a bounded set and later resets cost nothing.
+        """
+        key = (chat_id, user_id)
+        now = time.time()
+        if key in self._counts:
+            if self._current(key) == 0 and key not in self._dirty:
+                return
+            self._put(key, 0, now)
+        elif key not in self._dirty:
+            if self._cleared.get(key) is not None:
+                return
+            self._cleared.set(key, True)
+        self._mark_dirty(key, 0, now)
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        try:
+            await run_db(warnings_collection.create_index, [("chat_id", 1), ("user_id", 1)], unique=True)
+            try:
+                await run_db(warnings_collection.create_index, "updated_at", expireAfterSeconds=self.ttl)
+            except pymongo.errors.OperationFailure as e:
+                if e.code != INDEX_OPTIONS_CONFLICT:
+                    raise
+                # WARNING_TTL changed since the index was created
+                await run_db(
+                    db.command, "collMod", warnings_collection.name,
+                    index={"keyPattern": {"updated_at": 1}, "expireAfterSeconds": self.ttl}
+                )
+                logger.info("Updated warnings TTL index expire_after=%s", self.ttl)
+        except pymongo.errors.OperationFailure as e:
+            # Retrying won't help; counters are still written without the index
+            logger.error("Failed to create warnings indexes error=%s", e)
+        self._indexes_ready = True
+
+    async def flush(self):
+        """Write all dirty counters to MongoDB in a single unordered bulk_write."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        operations = []
+        for (chat_id, user_id), (count, updated_at) in dirty.items():
+            query = {"chat_id": Int64(chat_id), "user_id": Int64(user_id)}
+            if count:
+                operations.append(UpdateOne(
+                    query,
+                    {"$set": {"count": count, "updated_at": datetime.utcfromtimestamp(updated_at)}},
+                    upsert=True
+                ))
+            else:
+                operations.append(DeleteOne(query))
+        try:
+            await self.ensure_indexes()
+        except pymongo.errors.PyMongoError as e:
+            logger.warning("Could not ensure warnings indexes, retrying on next flush error=%s", e)
+        try:
+            await run_db(warnings_collection.bulk_write, operations, ordered=False)
+        except pymongo.errors.PyMongoError as e:
+            logger.error("Failed to flush warning counters count=%s error=%s", len(operations), e)
+            # Put the batch back unless a newer value was recorded meanwhile
+            for key, value in dirty.items():
+                self._dirty.setdefault(key, value)
+
+    def stats(self):
+        return {"cached": len(self._counts), "dirty": len(self._dirty), "cleared": len(self._cleared)}
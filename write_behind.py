@@ -0,0 +1,133 @@
+from pymongo import UpdateOne
+from cache import LRUCache
+import asyncio
+import logging
+import pymongo.errors
+
+logger = logging.getLogger(__name__)
+
+class BatchFlusher:
+    """Base for write-behind buffers flushed by a background task.
+
+    Subclasses implement flush() and call _pending_changed() after buffering
+    a write; flush() then runs every flush_interval seconds, or as soon as
+    flush_batch writes are pending.
+    """
+
+    def __init__(self, flush_interval, flush_batch):
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._flush_event = asyncio.Event()
+        self._flusher = None
+        self._closing = False
+
+    async def flush(self):
+        raise NotImplementedError
+
+    def _pending_changed(self, pending):
+        self._ensure_flusher()
+        if pending >= self.flush_batch:
+            self._flush_event.set()
+
+    def _ensure_flusher(self):
+        if self._closing:
+            return
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._run_flusher())
+
+    async def _run_flusher(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self.flush()
+
+    async def close(self):
+        """Stop the background flusher and write out anything still pending."""
+        self._closing = True
+        self._flush_event.set()
+        if self._flusher is not None:
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+
+class WriteBehindQueue(BatchFlusher):
+    """Coalescing write-behind buffer of upserts for one collection.
+
+    put() records an upsert keyed by its filter; later puts for the same key
+    merge into the pending one. Pending upserts are flushed as a single
+    unordered bulk_write every flush_interval seconds, or as soon as
+    flush_batch keys are pending. Once a key has been written, a later upsert
+    whose $set matches the last one flushed is a no-op ($setOnInsert no longer
+    applies) and is skipped.
+
+    run_db is the coroutine function used to run blocking pymongo calls
+    (database.run_db).
+    """
+
+    def __init__(self, collection, run_db, flush_interval=2, flush_batch=500, remember=100000):
+        super().__init__(flush_interval, flush_batch)
+        self.collection = collection
+        self.run_db = run_db
+        self.remember = remember
+        self.flushed = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self._pending = {}
+        self._written = LRUCache(remember)
+
+    def put(self, query, set_fields=None, set_on_insert=None):
+        """Queue an upsert of set_fields ($set) and set_on_insert ($setOnInsert) for query."""
+        key = tuple(sorted(query.items()))
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            _, pending_set, pending_insert = pending
+            pending_set.update(set_fields or {})
+            for field, value in (set_on_insert or {}).items():
+                pending_insert.setdefault(field, value)
+            return
+        set_fields = dict(set_fields or {})
+        if self._written.peek(key) == set_fields:
+            self.skipped += 1
+            return
+        self._pending[key] = (query, set_fields, dict(set_on_insert or {}))
+        self._pending_changed(len(self._pending))
+
+    def _remember(self, key, set_fields):
+        self._written.set(key, set_fields)
+
+    async def flush(self):
+        """Write all pending upserts in one unordered bulk_write."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        operations = []
+        for query, set_fields, set_on_insert in pending.values():
+            update = {}
+            # An upsert needs at least one operator; $set of the filter is a no-op
+            update["$set"] = set_fields or dict(query)
+            if set_on_insert:
+                update["$setOnInsert"] = set_on_insert
+            operations.append(UpdateOne(query, update, upsert=True))
+        try:
+            await self.run_db(self.collection.bulk_write, operations, ordered=False)
+        except pymongo.errors.PyMongoError as e:
+            logger.error("Failed to flush upserts collection=%s count=%s error=%s", self.collection.name, len(operations), e)
+            # Requeue unless a newer upsert for the key arrived meanwhile
+            for key, value in pending.items():
+                self._pending.setdefault(key, value)
+            return
+        self.flushed += len(operations)
+        for key, (_, set_fields, _) in pending.items():
+            self._remember(key, set_fields)
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "coalesced": self.coalesced,
+            "skipped": self.skipped
+        }